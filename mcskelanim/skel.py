@@ -24,6 +24,54 @@ def loc_matrix(location = (0,0,0), rotation=None):
 def convert_np_to_vt(my_array: np.ndarray) -> Vt.Vec3fArray:
     return Vt.Vec3fArray.FromNumpy(my_array)
 
+def key_value(value, default) -> list:
+  """Bedrock keyframe value as 3 floats, molang expressions fall back to
+  the default"""
+  if isinstance(value, dict):
+    value = value.get("post", value.get("pre", default))
+  if not isinstance(value, (list, tuple)):
+    value = [value] * 3
+  out = []
+  for v, d in zip(value, default):
+    try:
+      out.append(float(v))
+    except (TypeError, ValueError):
+      out.append(float(d))
+  return out
+
+def index_keys(key, default):
+  """Keyframes of a bone channel as sorted (frames, values) arrays, a
+  constant channel is a single key at frame 0"""
+  if not key:
+    return np.zeros(1, dtype=np.int64), np.array([default], dtype=np.float32)
+  if not isinstance(key, dict):
+    return np.zeros(1, dtype=np.int64), np.array([key_value(key, default)], dtype=np.float32)
+  times = np.array([round(float(t)*FPS) for t in key], dtype=np.int64)
+  values = np.array([key_value(v, default) for v in key.values()], dtype=np.float32)
+  order = np.argsort(times, kind="stable")
+  return times[order], values[order]
+
+def sample_keys(times, values, count) -> np.ndarray:
+  """Linear interpolation of the keys of index_keys over count frames,
+  held before the first and after the last key"""
+  frames = np.arange(count)
+  return np.stack([np.interp(frames, times, values[:, c]) for c in range(3)], axis=-1)
+
+def euler_to_quat(rotation: np.ndarray) -> np.ndarray:
+  """Euler angles in degrees, X then Y then Z, to quaternions laid out
+  as (i, j, k, real) like Vt.QuatfArray"""
+  half = np.radians(rotation) / 2
+  c = np.cos(half)
+  s = np.sin(half)
+  cx, cy, cz = c[..., 0], c[..., 1], c[..., 2]
+  sx, sy, sz = s[..., 0], s[..., 1], s[..., 2]
+  return np.stack([
+    sx*cy*cz - cx*sy*sz,
+    cx*sy*cz + sx*cy*sz,
+    cx*cy*sz - sx*sy*cz,
+    cx*cy*cz + sx*sy*sz,
+  ], axis=-1).astype(np.float32)
+
 
 class BedrockJSON:
   def request_json(self, path) -> list | dict:
@@ -209,58 +257,44 @@ class UsdRigWrite:
   ):
     # Convert length to integer frame, set
     frame = 0
-    if isinstance(length, float) and length != 0:
-      frame = int(round(length*FPS))
-    if self.stage.GetEndTimeCode() < length and extend_stage_end:
+    if length:
+      frame = int(round(float(length)*FPS))
+    if self.stage.GetEndTimeCode() < frame and extend_stage_end:
       self.stage.SetEndTimeCode(frame)
     
     anim = UsdSkel.Animation.Define(self.stage, f"/World/skel/{name}")
-    
-    translate = {}
-    rotate = {}
-    scale = {}
-    bone_list = []
-    _bone_list = []
+    bone_list = [self.topo[k] for k in bones]
+    anim.CreateJointsAttr().Set(bone_list)
 
-    
-    for f in range(frame):
-      _t = []
-      _r = []
-      _s = []
-      for k,v in bones.items():
-        # First loop read through the bone
-        # Second loop add it in
-        if f == 0:
-          _bone_list.append(k)
-          bone_list.append(self.topo[k])
-        if f == 1:
-          anim.CreateJointsAttr().Set(bone_list)
-        # Get the keyframes infomation
-        for k in ["location", "rotation", "scale"]:
-          key = v.get(k)
-          if key:
-            if isinstance(key, dict):
-              for fk, fv  in key.items():
-                if round(float(fk)*FPS) == f:
-                  if k == "location":
-                    _t.append(fv)
-                  elif k == "rotation":
-                    _r.append(fv)
-            else:
-              if k == "location":
-                _t.append(key)
-              elif k == "rotation":
-                _r.append(key)
-          else:
-            if k == "location":
-              _t.append([0,0,0])
-            elif k == "rotation":
-              _r.append([0,0,0])
-      if frame:
-        anim.CreateTranslationsAttr().Set(_t, f)
-      else:
-        anim.CreateTranslationsAttr().Set(_t)
-      # anim_rot = {}
+    # Index the keyframes of every bone once, then sample all the frames
+    count = max(frame, 1)
+    translate = np.zeros((count, len(bones), 3), dtype=np.float32)
+    rotate = np.zeros((count, len(bones), 3), dtype=np.float32)
+    scale = np.ones((count, len(bones), 3), dtype=np.float32)
+    for j,v in enumerate(bones.values()):
+      for k, out in [("location", translate), ("rotation", rotate), ("scale", scale)]:
+        default = out[0, j]
+        times, values = index_keys(v.get(k), default)
+        out[:, j] = sample_keys(times, values, count)
+    rotate = euler_to_quat(rotate)
+
+    attrs = [
+      (anim.CreateTranslationsAttr(), translate, Vt.Vec3fArray),
+      (anim.CreateRotationsAttr(), rotate, Vt.QuatfArray),
+      (anim.CreateScalesAttr(), scale.astype(np.float16), Vt.Vec3hArray),
+    ]
+    if not frame:
+      for attr, values, array in attrs:
+        attr.Set(array.FromNumpy(values[0]))
+      return anim
+    # Author the samples straight on the layer, notices are sent once
+    layer = self.stage.GetEditTarget().GetLayer()
+    with Sdf.ChangeBlock():
+      for attr, values, array in attrs:
+        path = attr.GetPath()
+        for f in range(frame):
+          layer.SetTimeSample(path, f, array.FromNumpy(values[f]))
+    return anim
     
   
   def from_json(self, bones):
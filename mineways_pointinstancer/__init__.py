@@ -0,0 +1,103 @@
+"""Mineways USD PointInstancer importer.
+
+The names below are imported from their submodule on first use, so
+importing the package is cheap and pxr or bpy are only loaded by the
+stages that need them. The Blender functions live in
+mineways_pointinstancer.blender."""
+import importlib
+
+# Public name to the submodule defining it
+_EXPORTS = {
+    "read_path": "usd",
+    "voxelmap_path": "usd",
+    "read_usd": "usd",
+    "index_chunks": "usd",
+    "select_chunks": "usd",
+    "read_chunk": "usd",
+    "type_names": "usd",
+    "read_chunk_parallel": "usd",
+    "decode_chunks": "usd",
+    "iter_chunks": "usd",
+    "read_block": "usd",
+    "register_blocks": "usd",
+    "read_mesh": "usd",
+    "block_names": "usd",
+    "filter_blocks": "chunks",
+    "filter_points": "chunks",
+    "flatten_chunks": "chunks",
+    "chunk_slice": "chunks",
+    "new_blocks": "chunks",
+    "finish_blocks": "chunks",
+    "global_indices": "chunks",
+    "narrow_dtype": "chunks",
+    "encode_chunk": "chunks",
+    "pack_chunks": "chunks",
+    "compact_chunks": "chunks",
+    "decode_chunk": "chunks",
+    "expand_chunks": "chunks",
+    "voxel_coords": "chunks",
+    "inspect_world": "inspection",
+    "cache_path": "cache",
+    "file_hash": "cache",
+    "source_stamp": "cache",
+    "save_cache": "cache",
+    "load_cache": "cache",
+    "peak_rss": "report",
+    "chunk_counters": "report",
+    "mesh_counters": "report",
+    "new_report": "report",
+    "report_stage": "report",
+    "write_report": "report",
+    "NEIGHBOURS": "voxel",
+    "voxel_grid": "voxel",
+    "voxel_keys": "voxel",
+    "voxel_lookup": "voxel",
+    "voxel_neighbours": "voxel",
+    "adjacent_point": "voxel",
+    "TRANSPARENT_BLOCKS": "voxel",
+    "block_opacity": "voxel",
+    "mask_chunks": "voxel",
+    "cull_occluded": "voxel",
+    "new_layer": "convert",
+    "copy_world_layer": "convert",
+    "block_faces": "convert",
+    "greedy_quads": "convert",
+    "quad_geometry": "convert",
+    "write_greedy_layer": "convert",
+    "lod_cells": "convert",
+    "write_lod_layer": "convert",
+    "INSTANCE_ATTRIBUTES": "prune",
+    "used_prototypes": "prune",
+    "blocklib_layer": "prune",
+    "material_targets": "prune",
+    "write_pruned_library": "prune",
+    "CHUNK_SIZE": "region",
+    "region_name": "region",
+    "region_tiles": "region",
+    "write_region_layer": "region",
+    "POINT_ATTRIBUTES": "buffers",
+    "point_buffers": "buffers",
+    "build_point_mesh": "buffers",
+    "texture_files": "textures",
+    "dedupe_textures": "textures",
+    "pack_atlas": "textures",
+    "write_texture_layer": "textures",
+    "chunk_hashes": "incremental",
+    "diff_chunks": "incremental",
+    "read_world": "pipeline",
+    "build_world": "pipeline",
+    "import_world": "pipeline",
+}
+
+__all__ = list(_EXPORTS)
+
+def __getattr__(name):
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError("module %r has no attribute %r" % (__name__, name))
+    value = getattr(importlib.import_module('.' + module, __name__), name)
+    globals()[name] = value
+    return value
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
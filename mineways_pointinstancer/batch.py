@@ -0,0 +1,199 @@
+"""Batch conversion of Mineways exports on worker processes, without Blender"""
+import argparse
+import json
+import multiprocessing
+import os
+import threading
+import time
+import traceback
+from multiprocessing import connection
+
+import mineways_pointinstancer as pt
+
+USD_EXTENSIONS = ('.usd', '.usda', '.usdc')
+
+def find_exports(inputs):
+    """Mineways exports among the given files and directories. A directory
+    is searched recursively for USD files with a BlockLibrary next to them,
+    which leaves out the layers written by the convert stages."""
+    exports = []
+    for item in inputs:
+        if os.path.isfile(item):
+            exports.append(os.path.abspath(item))
+            continue
+        for directory, _, files in os.walk(item):
+            for name in sorted(files):
+                file_path = os.path.abspath(os.path.join(directory, name))
+                if (os.path.splitext(name)[1].lower() in USD_EXTENSIONS
+                        and os.path.isfile(pt.read_path(file_path).get("blocklib_filepath"))):
+                    exports.append(file_path)
+    return sorted(set(exports))
+
+def watch_memory(max_memory, exceeded, interval=0.05):
+    """Call exceeded from a daemon thread once the resident memory of this
+    process goes over max_memory MiB, where the platform reports it"""
+    if not max_memory or pt.peak_rss() is None:
+        return None
+
+    def watch():
+        while pt.peak_rss() <= max_memory:
+            time.sleep(interval)
+        exceeded()
+
+    thread = threading.Thread(target=watch, name="watch_memory", daemon=True)
+    thread.start()
+    return thread
+
+def convert_world(file_path, options):
+    """Run the pxr only stages on one export and write its outputs next to
+    it, with a <file>_report.json. Errors are returned in the summary
+    instead of raised so one broken world does not stop the batch."""
+    paths = pt.read_path(file_path)
+    report = pt.new_report(paths)
+    summary = {"file_path": file_path, "world_name": paths.get("world_name"), "outputs": []}
+    then = time.time()
+    try:
+        world = pt.read_world(file_path, cull=options.get("cull"), cache=options.get("cache"),
+                              textures=options.get("textures"), prune=options.get("prune"),
+                              filters=options.get("filters"), report=report)
+        chunks = world.get("chunks")
+        blocks = world.get("blocks")
+        meshes = world.get("meshes")
+        summary["outputs"].extend(stage["counters"]["layer"] for stage in report["stages"]
+                                  if stage["stage"] in ("prune", "textures"))
+        usd_paths = world.get("usd_paths")
+        if usd_paths is None and (options.get("greedy") or options.get("lod") or options.get("regions")):
+            # Cache hit, the layers below only need the root layer and the BlockLib
+            with pt.report_stage(report, "read_usd"):
+                usd_paths = pt.read_usd(paths, chunks=False)
+
+        if options.get("greedy"):
+            with pt.report_stage(report, "greedy"):
+                summary["outputs"].append(pt.write_greedy_layer(paths, usd_paths, chunks, blocks, meshes))
+        if options.get("lod"):
+            with pt.report_stage(report, "lod"):
+                summary["outputs"].append(pt.write_lod_layer(paths, usd_paths, chunks, blocks, meshes))
+        if options.get("regions"):
+            with pt.report_stage(report, "regions") as counters:
+                counters.update(pt.write_region_layer(paths, usd_paths, chunks, blocks, options.get("regions")))
+                summary["outputs"].append(counters["layer"])
+        summary["counters"] = report["counters"]
+    except Exception:
+        summary["error"] = traceback.format_exc()
+    report_path = os.path.join(os.path.dirname(file_path), paths.get("file_name") + '_report.json')
+    pt.write_report(report, report_path)
+    summary["report"] = report_path
+    summary["seconds"] = time.time() - then
+    summary["peak_rss_mb"] = pt.peak_rss()
+    return summary
+
+def run_world(file_path, options, max_memory, conn):
+    """Worker process of run_batch, sends the convert_world summary back
+    through conn. Going over the memory budget ends the process at once
+    with an error summary, pxr calls cannot be interrupted any other way."""
+    def exceeded():
+        conn.send({"file_path": file_path, "peak_rss_mb": pt.peak_rss(),
+                   "error": "MemoryError: over the memory budget of %d MiB" % max_memory})
+        conn.close()
+        os._exit(1)
+
+    watch_memory(max_memory, exceeded)
+    conn.send(convert_world(file_path, options))
+    conn.close()
+
+def run_batch(exports, options, workers=None, max_memory=None, timeout=None):
+    """Convert every export in a fresh process of its own, at most workers
+    at a time, so the memory of a large world is returned to the system
+    before the next one starts. A world over max_memory MiB of resident
+    memory, past timeout seconds or whose process dies gets an error
+    summary and the batch goes on."""
+    context = multiprocessing.get_context('spawn')
+    workers = workers or os.cpu_count() or 1
+    pending = list(enumerate(exports))
+    running = {}
+    results = [None] * len(exports)
+    while pending or running:
+        while pending and len(running) < workers:
+            index, file_path = pending.pop(0)
+            receive, send = context.Pipe(duplex=False)
+            process = context.Process(target=run_world, args=(file_path, options, max_memory, send))
+            process.start()
+            send.close()
+            running[index] = (process, receive, time.time())
+        # A pipe is ready when its summary arrives or its process dies
+        connection.wait([receive for _, receive, _ in running.values()], timeout=1.0)
+        for index, (process, receive, started) in list(running.items()):
+            file_path = exports[index]
+            if receive.poll():
+                try:
+                    summary = receive.recv()
+                except EOFError:
+                    process.join()
+                    summary = {"file_path": file_path, "error": "worker exited with code %s" % process.exitcode}
+            elif timeout and time.time() - started > timeout:
+                process.terminate()
+                summary = {"file_path": file_path, "error": "TimeoutError: over %s seconds" % timeout}
+            else:
+                continue
+            process.join(5)
+            if process.is_alive():
+                process.terminate()
+                process.join()
+            receive.close()
+            results[index] = summary
+            del running[index]
+    return results
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Preprocess Mineways USD exports without Blender")
+    parser.add_argument("inputs", nargs='+', help="export files or directories to search")
+    parser.add_argument("--inspect", action="store_true",
+                        help="only report block counts and bounds from the root layers, no conversion")
+    parser.add_argument("--names", action="store_true",
+                        help="with --inspect, also read the block names from the BlockLibrary layer")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes, one world each")
+    parser.add_argument("--max-memory", type=int, default=None, help="resident memory budget per worker in MiB")
+    parser.add_argument("--timeout", type=float, default=None, help="seconds allowed per world")
+    parser.add_argument("--filters", type=json.loads, default=None,
+                        help='block filters as JSON, e.g. \'{"exclude": {"name": ["*leaves*"]}}\'')
+    parser.add_argument("--cull", action="store_true", help="drop blocks buried under opaque blocks")
+    parser.add_argument("--cache", action="store_true", help="keep the decoded tables next to each export")
+    parser.add_argument("--greedy", action="store_true", help="write the <file>_greedy.usda layer")
+    parser.add_argument("--lod", action="store_true", help="write the <file>_lod.usda layer")
+    parser.add_argument("--regions", type=int, default=None, metavar="TILE",
+                        help="write the <file>_regions.usdc layer merging TILE x TILE chunks")
+    parser.add_argument("--prune", action="store_true", help="write the <file>_blocks.usda layer")
+    parser.add_argument("--textures", choices=['dedupe', 'atlas'], help="write the <file>_textures.usda layer")
+    parser.add_argument("--summary", default="batch_summary.json", help="summary report of the whole batch")
+    args = parser.parse_args(argv)
+
+    exports = find_exports(args.inputs)
+    if args.inspect:
+        results = [pt.inspect_world(pt.read_path(file_path), args.names) for file_path in exports]
+        for result in results:
+            print("%8d instances %5d chunks %4d blocks %s" % (
+                result["instances"], result["chunks"], result["prototypes"], result["file_path"]))
+        with open(args.summary, 'w') as f:
+            json.dump(results, f, indent=2)
+        return results
+    options = {"filters": args.filters, "cull": args.cull, "cache": args.cache, "greedy": args.greedy,
+               "lod": args.lod, "prune": args.prune,
+               "regions": args.regions, "textures": args.textures}
+    then = time.time()
+    results = run_batch(exports, options, args.workers, args.max_memory, args.timeout)
+    failed = [r for r in results if r.get("error")]
+    for result in results:
+        print("%-8s %s" % ("failed" if result.get("error") else "%.2f s" % result["seconds"], result["file_path"]))
+    summary = {
+        "options": options,
+        "worlds": len(results),
+        "failed": len(failed),
+        "seconds": time.time() - then,
+        "results": results,
+    }
+    with open(args.summary, 'w') as f:
+        json.dump(summary, f, indent=2, default=str)
+    return summary
+
+if __name__ == "__main__":
+    main()
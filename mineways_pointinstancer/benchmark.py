@@ -0,0 +1,115 @@
+"""Read benchmarks of the pipeline stages on synthetic exports"""
+import argparse
+import json
+import multiprocessing
+import os
+import subprocess
+import sys
+import tempfile
+
+import mineways_pointinstancer as pt
+from mineways_pointinstancer import synth_stage
+
+# (chunks, points per chunk) of each run
+SCALES = [(16, 1024), (64, 4096), (256, 4096), (1024, 4096)]
+
+# Imports timed by --startup, each in a fresh interpreter
+STARTUP = [
+    ("package", "import mineways_pointinstancer"),
+    ("chunks", "import mineways_pointinstancer.chunks"),
+    ("usd", "import mineways_pointinstancer.usd"),
+    ("pipeline", "import mineways_pointinstancer.pipeline"),
+]
+
+def bench_startup(repeat=5):
+    """Import time of each STARTUP statement in a fresh interpreter, the
+    best of repeat runs"""
+    env = dict(os.environ)
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env["PYTHONPATH"] = os.pathsep.join(p for p in (root, env.get("PYTHONPATH")) if p)
+    results = []
+    for name, statement in STARTUP:
+        code = "import time; t = time.perf_counter(); %s; print(time.perf_counter() - t)" % statement
+        times = [float(subprocess.run([sys.executable, "-c", code], env=env, check=True,
+                                      capture_output=True, text=True).stdout) for _ in range(repeat)]
+        results.append({"stage": name, "seconds": min(times)})
+    return results
+
+def bench_world(file_path):
+    """Time the read stages of one export in this process"""
+    paths = pt.read_path(file_path)
+    report = pt.new_report(paths)
+    with pt.report_stage(report, "read_usd") as counters:
+        usd_paths = pt.read_usd(paths)
+        counters["chunks"] = sum('Chunk' in c.GetName() for c in usd_paths["chunk"])
+    with pt.report_stage(report, "read_chunk") as counters:
+        chunks = pt.read_chunk(usd_paths, flat=True)
+        counters.update(pt.chunk_counters(chunks))
+    with pt.report_stage(report, "read_block") as counters:
+        blocks = pt.read_block(usd_paths, chunks)
+        counters["prototypes"] = len(blocks["path"])
+    with pt.report_stage(report, "read_mesh") as counters:
+        meshes = pt.read_mesh(usd_paths, blocks)
+        counters.update(pt.mesh_counters(meshes))
+
+    points = len(chunks.get("points"))
+    stages = report["stages"]
+    for stage in stages:
+        stage["points_per_second"] = points / stage["seconds"] if stage["seconds"] else None
+    return {
+        "chunks": len(chunks.get("chunks")),
+        "points": points,
+        "prototypes": len(blocks.get("path")),
+        "materials": len(meshes.get("material")),
+        "stages": stages,
+    }
+
+def bench_scale(chunks, points, prototypes=64, merged_ratio=0.25):
+    """Generate a world of the given scale and time it in a fresh process,
+    so the peak memory of one scale does not leak into the next"""
+    with tempfile.TemporaryDirectory() as root:
+        paths = synth_stage.write_world(root, chunks, points, prototypes, merged_ratio)
+        context = multiprocessing.get_context('spawn')
+        with context.Pool(1) as pool:
+            result = pool.apply(bench_world, (paths.get("file_path"),))
+    result["scale"] = {"chunks": chunks, "points_per_chunk": points,
+                       "prototypes": prototypes, "merged_ratio": merged_ratio}
+    return result
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the Mineways USD read stages")
+    parser.add_argument("--scale", action="append", default=None,
+                        help="chunks x points per chunk, e.g. 64x4096, can be repeated")
+    parser.add_argument("--prototypes", type=int, default=64)
+    parser.add_argument("--merged-ratio", type=float, default=0.25)
+    parser.add_argument("--startup", action="store_true", help="only time the package imports")
+    parser.add_argument("--output", help="write the results as JSON")
+    args = parser.parse_args(argv)
+
+    if args.startup:
+        results = bench_startup()
+        for stage in results:
+            print("  %-10s %8.3f s" % (stage["stage"], stage["seconds"]))
+        if args.output:
+            with open(args.output, 'w') as f:
+                json.dump(results, f, indent=2)
+        return results
+
+    scales = SCALES
+    if args.scale:
+        scales = [tuple(int(v) for v in s.lower().split('x')) for s in args.scale]
+    results = []
+    for chunks, points in scales:
+        result = bench_scale(chunks, points, args.prototypes, args.merged_ratio)
+        results.append(result)
+        print("%5d chunks x %5d points" % (chunks, points))
+        for stage in result["stages"]:
+            print("  %-10s %8.3f s %12.0f pts/s %8.1f MiB" % (
+                stage["stage"], stage["seconds"], stage["points_per_second"] or 0, stage["peak_rss_mb"] or 0))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    return results
+
+if __name__ == "__main__":
+    main()
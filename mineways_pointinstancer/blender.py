@@ -0,0 +1,445 @@
+"""Blender side of the import, needs bpy"""
+import math
+import time
+import bpy
+from .buffers import build_point_mesh, point_buffers
+from .report import report_stage
+
+D = bpy.data
+C = bpy.context
+
+def create_pts(paths,chunks,blocks,only=None,hashes=None):
+    """Create points with attributes
+    only : set of chunk names to build, all chunks when None
+    hashes : content hash of every chunk, stored on the mesh"""
+    file_name = paths.get("file_name")  # file name
+    ch = chunks.get("chunks")       # chunks
+    
+    object_mesh = []
+    for ic,chunk in enumerate(ch):
+        if only is not None and chunk not in only:
+            continue
+        mesh_name  = file_name+ ' - '+ 'PT_' +chunk.split('/')[1]
+        if not bool(D.meshes.get(mesh_name)):
+            mesh = D.meshes.new(mesh_name)  # add the new 
+        else:
+            mesh = D.meshes[mesh_name]
+            D.meshes.remove(mesh,do_unlink=True) 
+            mesh = D.meshes.new(mesh_name)
+
+        build_point_mesh(mesh, point_buffers(chunks, blocks, ic))
+        mesh["mineways_chunk"] = chunk
+        if hashes is not None:
+            mesh["mineways_hash"] = hashes[ic]
+        object_mesh.append(mesh)
+    return object_mesh
+
+def register_progressive(items, build, budget=0.05, done=None):
+    """Build the chunks of iter_chunks from a Blender timer, calling build
+    on chunks for about budget seconds per tick so the UI stays responsive.
+    done is called once every chunk is built. Returns a function that
+    cancels the import on the next tick and stops the reader."""
+    cancelled = []
+
+    def tick():
+        start = time.time()
+        while not cancelled:
+            item = next(items, None)
+            if item is None:
+                if done:
+                    done()
+                return None
+            build(item)
+            if time.time() - start > budget:
+                return 0.0
+        items.close()
+        return None
+
+    def cancel():
+        cancelled.append(True)
+    bpy.app.timers.register(tick)
+    return cancel
+
+def read_import_hashes(paths):
+    """Chunk name to content hash of the chunk meshes already imported"""
+    prefix = paths.get("file_name") + ' - PT_'
+    hashes = {}
+    for mesh in D.meshes:
+        if mesh.name.startswith(prefix) and "mineways_hash" in mesh:
+            hashes[mesh["mineways_chunk"]] = mesh["mineways_hash"]
+    return hashes
+
+def remove_chunks(paths, names):
+    """Delete the objects, meshes and node groups of removed chunks"""
+    for chunk in names:
+        mesh_name = paths.get("file_name") + ' - PT_' + chunk.split('/')[1]
+        if D.objects.get(mesh_name):
+            D.objects.remove(D.objects[mesh_name], do_unlink=True)
+        if D.meshes.get(mesh_name):
+            D.meshes.remove(D.meshes[mesh_name], do_unlink=True)
+        if D.node_groups.get(chunk.split('/')[1]):
+            D.node_groups.remove(D.node_groups[chunk.split('/')[1]])
+
+def create_collection(name,parent = None):
+    #Create collection, if exist get it.
+    if not bool(D.collections.get(name)):
+        collection =  D.collections.new(name)
+        if parent != None:
+            parent.children.link(collection)
+        else:
+            C.scene.collection.children.link(collection)
+    else:
+        collection = D.collections[name]
+    return collection
+
+def moveto_collection(objects,collection):
+    # Unlink objects in all collection, link it to new one 
+    for obj in objects:
+        for col in obj.users_collection:
+            col.objects.unlink(obj) 
+        collection.objects.link(obj)
+
+def create_usd_collection(paths, report=None, import_path=None):
+    """ Create collection to store usd and fix merged blocks
+    Example: Grass Block is Block_2_0 need to merge all meshes
+    dirt,grass_block_side,grass_block_top into one
+    import_path : layer to import instead of the export, e.g. the pruned one """
+    from mathutils import Matrix
+    # Create the USD collections
+    collections = []
+    file_name = paths.get("file_name")
+    world_name = paths.get("world_name")
+    
+    usd_col = create_collection(file_name + " USD Collection")
+    pt_col = create_collection(file_name + " USD Points",usd_col)
+    block_col = create_collection(file_name + " USD BlockLib",usd_col)
+    
+    collections.append([usd_col,pt_col,block_col])
+    
+    if not bool(D.objects.get(file_name +' Blocks')):
+        with report_stage(report, "usd_import") as counters:
+            bpy.ops.wm.usd_import(filepath=import_path or paths.get("file_path"),import_usd_preview=True)
+            counters["objects"] = len(C.selected_objects)
+        
+        objs = C.selected_objects
+        moveto_collection(objs,block_col)
+    
+        #Fix all the block merge and apply 
+        block_objs = block_col.objects['Blocks'].children_recursive
+        rot = Matrix.Rotation(math.radians(90),4,'X')
+        loc = Matrix.Translation((-0.5,-0.5,-0.5))
+        
+        path = ['Looks','Blocks','VoxelMap',world_name.replace(' ','_')]
+
+        if D.objects[path[2]]:
+            for child in D.objects[path[2]].children_recursive:
+                D.objects.remove(child,do_unlink=True)
+            D.objects.remove(D.objects[path[2]],do_unlink=True)
+        for obj in D.objects:
+            if obj.name in path and not 'Block' in obj.name:
+                for child in obj.children_recursive:
+                    child.name = file_name + ' '+ child.name
+                obj.name =  file_name + ' '+obj.name
+        if bool(D.objects.get('Blocks')):
+            obj = D.objects['Blocks']  
+            obj.name =  file_name + ' '+obj.name
+
+        new_i = 0
+        row = 0
+        column = 0
+        for i,obj in enumerate(block_objs):
+        
+            pre_loc = Matrix.Translation((row,-2,column))
+            try:
+                if obj.type != 'MESH' and 'Block' in obj.name:
+                    merge_mesh = D.meshes.new(obj.name + '_merge')
+                    merge_obj = D.objects.new(merge_mesh.name, merge_mesh)
+                    merge_obj.parent = obj.parent
+                    merge_obj.location = obj.location
+                    col = obj.users_collection[0]
+                    col.objects.link(merge_obj)
+                    
+                    bpy.ops.object.select_all(action='DESELECT')
+                    bpy.context.view_layer.objects.active = merge_obj
+                    merge_obj.select_set(True)
+                    for children_mesh in obj.children:
+                        children_mesh.select_set(True)
+                    
+                    D.objects.remove(obj,do_unlink=True)                
+                    bpy.ops.object.join()
+                    
+                    ma = rot @ loc
+                    me = merge_obj.data
+                    me.transform(ma)
+                    
+                    merge_obj.matrix_world = pre_loc
+                elif obj.type == 'MESH':
+                    
+                    ma = rot @ loc
+                    me = obj.data
+                    me.transform(ma)
+                    
+                    obj.matrix_world = pre_loc
+            except: # Except broken cause by previous merge RNA blocks
+                new_i-=1
+                pass
+            new_i+=1
+            row = new_i % 16
+            column = math.floor(new_i / 16)
+        fix_material(D.materials)
+    return collections
+
+def create_asset():
+    """Create node group assets """
+    if not bool(D.node_groups.get("Post_Surface")):
+        surface = D.node_groups.new('Post_Surface','GeometryNodeTree')
+        surface.inputs.new(type='NodeSocketGeometry',name='Geometry')
+        surface.outputs.new(type='NodeSocketGeometry',name='Geometry')
+
+    if not bool(D.objects.get('Empty')):
+        mesh = D.meshes.new('EmptyMesh')
+        D.objects.new('Empty',mesh)    
+
+    if not bool(D.node_groups.get("Process")):
+        process = D.node_groups.new('Process','GeometryNodeTree')
+        process.inputs.new(type='NodeSocketGeometry',name='Geometry')
+        process.outputs.new(type='NodeSocketGeometry',name='Instances')
+        process.outputs.new(type='NodeSocketGeometry',name='Geometry')
+        out_process= process.nodes.new('NodeGroupOutput')
+
+        out_process.location = (800,0)
+
+        in_process = process.nodes.new('NodeGroupInput')
+
+        instanceNode = process.nodes.new('GeometryNodeInstanceOnPoints')
+        instanceNode.inputs[3].default_value = True
+        instanceNode.location = (300,0)
+        instanceNode.mute = True
+
+        rerouteNode = process.nodes.new('NodeReroute')
+        rerouteNode.location = (280,-25)
+
+        process.links.new(rerouteNode.inputs[0],in_process.outputs[0])
+        process.links.new(out_process.inputs[1],rerouteNode.outputs[0])
+        process.links.new(instanceNode.inputs[0],rerouteNode.outputs[0])
+        process.links.new(instanceNode.inputs[2],in_process.outputs[1])
+        process.links.new(out_process.inputs[0],instanceNode.outputs[0])
+        process.links.new(instanceNode.inputs[4],in_process.outputs[2])
+
+        process.inputs.new(type='NodeSocketInt',name='Block Index')
+        process.inputs.new(type='NodeSocketInt',name='Nbt Index')
+        
+    else:
+        process = D.node_groups["Process"]
+    return process
+
+def block_object(blocks, meshes, block, broke=None):
+    """Imported object of a global prototype, the Empty when it is missing,
+    the missing names are collected in broke"""
+    if not blocks["merged"][block]:
+        name = meshes["instance"][blocks["block"][block].strip('/')]
+    else:
+        name = blocks["block"][block].strip('/') + "_merge"
+    try:
+        inst = D.objects[name]
+    except:
+        try:
+            inst = D.objects[name+'.001']
+        except:
+            inst = D.objects['Empty']
+            if broke is not None:
+                broke.append(name)
+    return inst
+
+def create_block_collection(paths, blocks, meshes, broke=None):
+    """Collection with one object per global prototype, named so that the
+    alphabetical order Collection Info uses is the global block index.
+    Prototypes of an earlier import that are not in blocks are removed,
+    they would sort between these and shift every proto_index."""
+    name = paths.get("file_name") + " USD Block Prototypes"
+    collection = D.collections.get(name) or D.collections.new(name)
+    collection.use_fake_user = True
+    names = set()
+    for block in range(len(blocks["path"])):
+        inst = block_object(blocks, meshes, block, broke)
+        object_name = "%06d %s" % (block, blocks["block"][block].strip('/'))
+        names.add(object_name)
+        obj = D.objects.get(object_name)
+        if obj is None:
+            obj = D.objects.new(object_name, inst.data)
+        if collection.objects.get(object_name) is None:
+            collection.objects.link(obj)
+        obj.data = inst.data
+    for obj in list(collection.objects):
+        if obj.name not in names:
+            D.objects.remove(obj, do_unlink=True)
+    return collection
+
+def create_shared_nodegroup(paths, blocks, meshes, process, broke=None):
+    """ Create a single node group for all chunks, instancing from the
+    prototype collection by the proto_index point attribute"""
+    collection = create_block_collection(paths, blocks, meshes, broke)
+    nodegroup_name = paths.get("file_name") + " Blocks"
+    if bool(D.node_groups.get(nodegroup_name)):
+        instance = D.node_groups[nodegroup_name]
+        instance.nodes["Block Prototypes"].inputs[0].default_value = collection
+        return instance
+
+    instance = D.node_groups.new(nodegroup_name,'GeometryNodeTree')
+    out_instance = instance.nodes.new('NodeGroupOutput')
+    in_instance = instance.nodes.new('NodeGroupInput')
+    instance.inputs.new(type='NodeSocketGeometry',name='Geometry')
+    out_instance.location = (800,0)
+
+    block_node = instance.nodes.new('GeometryNodeCollectionInfo')
+    block_node.name = "Block Prototypes"
+    block_node.label = block_node.name
+    block_node.location = (-200,-200)
+    block_node.inputs[0].default_value = collection
+    block_node.inputs[1].default_value = True # separate children
+    block_node.inputs[2].default_value = True # reset children
+
+    process_group = instance.nodes.new("GeometryNodeGroup")
+    process_group.name = "Process"
+    process_group.node_tree = process
+    process_group.location =  (300,0)
+
+    instance.links.new(out_instance.inputs[0],process_group.outputs[0])
+    instance.links.new(process_group.inputs[1],block_node.outputs[0])
+
+    instance.links.new(process_group.inputs[0],in_instance.outputs[0])
+    instance.links.new(process_group.inputs[2],in_instance.outputs[1])
+    instance.links.new(process_group.inputs[3],in_instance.outputs[2])
+    instance.links.new(process_group.inputs[4],in_instance.outputs[3])
+    return instance
+
+def create_nodegroup(chunks,blocks,meshes,process,only=None,broke=None):
+    """ Create a node group for instancing on the object,
+    only the chunks named in only when it is given"""
+    chunks = chunks.get("chunks")
+    block_remap = blocks.get("remap")
+    node_groups = []
+    for ic,chunk in enumerate(chunks):
+        if only is not None and chunk not in only:
+            continue
+        nodegroup_name = chunk.split('/')[1]
+        if not bool(D.node_groups.get(nodegroup_name)):
+            instance = D.node_groups.new(chunk.split('/')[1],'GeometryNodeTree')
+            out_instance = instance.nodes.new('NodeGroupOutput')
+            in_instance = instance.nodes.new('NodeGroupInput')
+            instance.inputs.new(type='NodeSocketGeometry',name='Geometry')
+            
+            out_instance.location = (800,0)
+            join_block = instance.nodes.new('GeometryNodeJoinGeometry')
+            join_block.name='Join Block Instances'
+            join_block.location = (-200,-200)
+            frame_block = instance.nodes.new('NodeFrame')
+            frame_block.name = chunk.split('/')[1]+'_Blocks'
+            frame_block.label = frame_block.name
+            join_block.parent = frame_block
+            i = 0                
+            
+        else:
+            instance = D.node_groups[nodegroup_name]
+            join_block = instance.nodes['Join Block Instances']
+            frame_block = instance.nodes[nodegroup_name+'_Blocks']
+
+        for node in instance.nodes:
+            if node.type == 'OBJECT_INFO':
+                instance.nodes.remove(node)
+        i=0
+        for block in reversed(block_remap[ic]):
+            inst = block_object(blocks, meshes, block, broke)
+
+            block_node = instance.nodes.new('GeometryNodeObjectInfo')
+            block_node.name = inst.name
+            block_node.label = inst.name
+            block_node.hide = True
+            block_node.location = (-500,-500+i)
+            block_node.inputs[1].default_value = True
+            block_node.parent = frame_block
+            instance.links.new(join_block.inputs[0],block_node.outputs[3])
+            i+=50
+            if inst.type == 'MESH':
+                block_node.inputs[0].default_value = inst
+        
+        if not bool(instance.nodes.get("Process")):
+            process_group = instance.nodes.new("GeometryNodeGroup")
+            process_group.name = "Process"
+            process_group.node_tree = process
+            process_group.location =  (300,0)
+        
+            instance.links.new(out_instance.inputs[0],process_group.outputs[0])
+            instance.links.new(process_group.inputs[1],join_block.outputs[0])
+            
+            instance.links.new(process_group.inputs[0],in_instance.outputs[0])
+            instance.links.new(process_group.inputs[2],in_instance.outputs[1])
+            instance.links.new(process_group.inputs[3],in_instance.outputs[2])
+            instance.links.new(process_group.inputs[4],in_instance.outputs[3])
+        node_groups.append(instance)
+    return node_groups
+
+def create_object(meshes,collection,node_groups,index_attribute="instance_index"):
+    """Create the object and apply the point instancing node group of the
+    same position in node_groups, index_attribute picks the instance,
+    proto_index for the shared group"""
+    for im,mesh in enumerate(meshes):
+        object_name  = mesh.name
+        if not bool(D.objects.get(mesh.name)):
+            obj = D.objects.new(mesh.name, mesh)
+            collection.objects.link(obj)
+            # d = Matrix.Rotation(math.radians(90),4,'X')
+            # obj.matrix_world = d
+        else:
+            obj = D.objects[object_name]
+            obj.data = mesh
+#        print(instances[im])
+        if not bool(obj.modifiers.get("Point Instancer")):
+            mod = obj.modifiers.new('Point Instancer','NODES')
+            
+            mod.node_group = node_groups[im]
+            mod["Input_2_use_attribute"] = True 
+            mod["Input_2_attribute_name"] = index_attribute
+            mod["Input_3_use_attribute"] = True 
+            mod["Input_3_attribute_name"] = "block_index"
+            mod["Input_4_use_attribute"] = True 
+            mod["Input_4_attribute_name"] = "nbt_index"
+        else:
+            pass
+
+def lprint(list):
+    for l in list:
+        print(l)
+
+def fix_material(materials):
+    for mat in materials:
+        try:
+            img = mat.node_tree.nodes["Image Texture"]
+            img.interpolation = 'Closest'
+        except:
+            pass
+
+def clean_mesh(meshes):
+    for mesh in meshes:
+        D.meshes.remove(mesh,do_unlink=True)
+
+def clean_mat(materials):
+    for material in materials:
+        D.materials.remove(material,do_unlink=True)
+
+def clean_image(images):
+    for img in images:
+        D.images.remove(img,do_unlink=True)
+
+def clean_obj(objs):
+    for obj in objs:
+        D.objects.remove(obj,do_unlink=True)
+
+def clean_collection(collection):
+    cols = collection.children_recursive
+    for col in cols:
+        objs = col.objects
+        for obj in objs:
+            D.objects.remove(obj,do_unlink=True) 
+        D.collections.remove(col,do_unlink=True) 
+    D.collections.remove(collection,do_unlink=True)
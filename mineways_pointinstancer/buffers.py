@@ -0,0 +1,41 @@
+"""Contiguous buffers of the chunk point meshes"""
+import numpy as np
+from .chunks import chunk_slice
+
+# Integer point attributes of the chunk point meshes
+POINT_ATTRIBUTES = ("instance_index", "block_index", "nbt_index", "proto_index")
+
+def point_buffers(chunks, blocks, ic):
+    """Contiguous buffers of one chunk point mesh, ready for foreach_set
+    'co' : flat float32 coordinates with Y and Z swapped to Blender's Z up
+    'instance_index' : int32 local prototype index
+    'block_index' : int32 Minecraft block id
+    'nbt_index' : int32 nbt sub id
+    'proto_index' : int32 global prototype index
+    """
+    points, indices = chunk_slice(chunks, ic)
+    proto = blocks["remap"][ic][indices]
+    co = np.empty((len(points), 3), dtype=np.float32)
+    co[:, 0] = points[:, 0]
+    co[:, 1] = points[:, 2]
+    co[:, 2] = points[:, 1]
+    buffers = {
+        "co": co.reshape(-1),
+        "instance_index": np.ascontiguousarray(indices, dtype=np.int32),
+        "block_index": blocks["id"][proto],
+        "nbt_index": blocks["sub_id"][proto],
+        "proto_index": proto.astype(np.int32),
+    }
+    return buffers
+
+def build_point_mesh(mesh, buffers):
+    """Fill an empty mesh with the vertices and integer point attributes
+    of point_buffers, one foreach_set call each"""
+    co = buffers.get("co")
+    mesh.vertices.add(len(co) // 3)
+    mesh.vertices.foreach_set("co", co)
+    for name in POINT_ATTRIBUTES:
+        attribute = mesh.attributes.new(name=name, type='INT', domain='POINT')
+        attribute.data.foreach_set("value", buffers.get(name))
+    mesh.update()
+    return mesh
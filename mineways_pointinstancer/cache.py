@@ -0,0 +1,131 @@
+"""On disk cache of the decoded tables"""
+import hashlib
+import json
+import os
+import shutil
+import numpy as np
+from pxr import Sdf
+from .chunks import flatten_chunks
+
+def cache_path(paths, options=None):
+    """Cache folder of an export, one entry per set of read options"""
+    digest = hashlib.sha1(json.dumps(options or {}, sort_keys=True).encode()).hexdigest()[:16]
+    directory = os.path.dirname(paths.get("file_path"))
+    return os.path.join(directory, paths.get("file_name") + '_cache', digest)
+
+def file_hash(file_path, block_size=1 << 20):
+    """Content hash of a file read in blocks"""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def source_stamp(paths):
+    """Path, size, mtime and content hash of the root layer and BlockLibrary"""
+    stamp = []
+    for key in ("file_path", "blocklib_filepath"):
+        file_path = paths.get(key)
+        if not file_path or not os.path.isfile(file_path):
+            stamp.append([key, None])
+            continue
+        st = os.stat(file_path)
+        stamp.append([key, os.path.abspath(file_path), st.st_size, st.st_mtime_ns, file_hash(file_path)])
+    return stamp
+
+def save_cache(paths, chunks, blocks, meshes, options=None):
+    """Store the decoded chunk, prototype and material tables as .npy files"""
+    folder = cache_path(paths, options)
+    if os.path.isdir(folder):
+        shutil.rmtree(folder)
+    os.makedirs(folder)
+    chunks = flatten_chunks(chunks)
+    remap = blocks.get("remap")
+    remap_offsets = np.zeros(len(remap) + 1, dtype=np.int64)
+    np.cumsum([len(r) for r in remap], out=remap_offsets[1:])
+
+    arrays = {
+        "points": chunks.get("points"),
+        "indices": chunks.get("indices"),
+        "offsets": chunks.get("offsets"),
+        "id": blocks.get("id"),
+        "sub_id": blocks.get("sub_id"),
+        "merged": blocks.get("merged"),
+        "remap": np.concatenate(remap) if remap else np.empty(0, dtype=np.int32),
+        "remap_offsets": remap_offsets,
+        "mesh_material": meshes.get("mesh_material"),
+        "material_texture": meshes.get("material_texture"),
+    }
+    for name, array in arrays.items():
+        np.save(os.path.join(folder, name + '.npy'), np.ascontiguousarray(array))
+
+    tables = {
+        "chunks": chunks.get("chunks"),
+        "path": [[str(t) for t in targets] for targets in chunks.get("path")],
+        "block_path": [str(p) for p in blocks.get("path")],
+        "block": blocks.get("block"),
+        "name": blocks.get("name"),
+        "mesh": [str(m.GetPath()) for m in meshes.get("mesh")],
+        "block_mesh": [[str(m.GetPath()) for m in b] for b in meshes.get("block")],
+        "material": [str(m) for m in meshes.get("material")],
+        "texture": [[t.path, t.resolvedPath] for t in meshes.get("texture")],
+        "instance": meshes.get("instance"),
+    }
+    with open(os.path.join(folder, 'tables.json'), 'w') as f:
+        json.dump(tables, f)
+    # Written last, an entry without manifest is incomplete
+    with open(os.path.join(folder, 'manifest.json'), 'w') as f:
+        json.dump({"source": source_stamp(paths), "options": options or {}}, f)
+    return folder
+
+def load_cache(paths, options=None):
+    """Load the cached chunks, blocks and meshes memory mapped, None when
+    there is no entry or the export changed since it was written.
+    Prims of the meshes table come back as their Sdf.Path"""
+    folder = cache_path(paths, options)
+    manifest_path = os.path.join(folder, 'manifest.json')
+    if not os.path.isfile(manifest_path):
+        return None
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+    if manifest.get("source") != source_stamp(paths):
+        shutil.rmtree(folder, ignore_errors=True)
+        return None
+
+    def load(name):
+        return np.load(os.path.join(folder, name + '.npy'), mmap_mode='r')
+    with open(os.path.join(folder, 'tables.json')) as f:
+        tables = json.load(f)
+
+    chunk_dict = {
+        "chunks": tables["chunks"],
+        "path": [[Sdf.Path(t) for t in targets] for targets in tables["path"]],
+        "points": load("points"),
+        "indices": load("indices"),
+        "offsets": load("offsets"),
+    }
+    remap = load("remap")
+    remap_offsets = load("remap_offsets")
+    block_path = [Sdf.Path(p) for p in tables["block_path"]]
+    block_dict = {
+        "path": block_path,
+        "block": tables["block"],
+        "name": tables["name"],
+        "id": load("id"),
+        "sub_id": load("sub_id"),
+        "merged": load("merged"),
+        "remap": [remap[remap_offsets[i]:remap_offsets[i + 1]] for i in range(len(remap_offsets) - 1)],
+        "lookup": {p: i for i, p in enumerate(block_path)},
+    }
+    material = [Sdf.Path(m) for m in tables["material"]]
+    mesh_dict = {
+        "block": [[Sdf.Path(m) for m in b] for b in tables["block_mesh"]],
+        "mesh": [Sdf.Path(m) for m in tables["mesh"]],
+        "material": material,
+        "texture": [Sdf.AssetPath(t[0], t[1]) for t in tables["texture"]],
+        "mesh_material": load("mesh_material"),
+        "material_texture": load("material_texture"),
+        "lookup": {m: i for i, m in enumerate(material)},
+        "instance": tables["instance"],
+    }
+    return chunk_dict, block_dict, mesh_dict
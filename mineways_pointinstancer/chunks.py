@@ -0,0 +1,284 @@
+"""Chunk tables in plain NumPy: flat and compact layouts, block filters and prototype remapping"""
+import fnmatch
+import numpy as np
+
+def filter_blocks(filters, targets, names=None):
+    """Bool array over prototype targets, True for the blocks kept by
+    filters = {"include": selector, "exclude": selector}, a block is kept
+    when it matches include, or there is none, and does not match exclude.
+    A selector matches a block by any of
+    'id' : block ids, or [id, nbt] pairs
+    'nbt' : nbt sub ids of any block id
+    'name' : fnmatch patterns of the block typeName, case insensitive
+    names : dict of block name to typeName, for the name patterns
+    """
+    keep = np.ones(len(targets), dtype=bool)
+    if not filters:
+        return keep
+    names = names or {}
+    target_names = [str(t).rsplit('/', 1)[-1] for t in targets]
+    ids = np.array([[int(v) for v in b.split("Block_")[1].split('_')[:2]] for b in target_names],
+                   dtype=np.int64).reshape(-1, 2)
+
+    def match(selector):
+        hit = np.zeros(len(targets), dtype=bool)
+        for entry in selector.get("id", []):
+            if isinstance(entry, (list, tuple)):
+                hit |= (ids[:, 0] == entry[0]) & (ids[:, 1] == entry[1])
+            else:
+                hit |= ids[:, 0] == entry
+        if selector.get("nbt"):
+            hit |= np.isin(ids[:, 1], selector.get("nbt"))
+        for pattern in selector.get("name", []):
+            hit |= np.array([fnmatch.fnmatchcase(str(names.get(b) or '').lower(), pattern.lower())
+                             for b in target_names], dtype=bool)
+        return hit
+
+    if filters.get("include"):
+        keep &= match(filters.get("include"))
+    if filters.get("exclude"):
+        keep &= ~match(filters.get("exclude"))
+    return keep
+
+def filter_points(pos, id, keep):
+    """Positions and protoIndices of the points whose prototype is kept"""
+    pos = np.asarray(pos if pos is not None else [], dtype=np.float32).reshape(-1, 3)
+    id = np.asarray(id if id is not None else [], dtype=np.int32)
+    mask = keep[id]
+    if mask.all():
+        return pos, id
+    return pos[mask], id[mask]
+
+def flatten_chunks(chunks):
+    """Pack per chunk point lists into world arrays with a CSR offset table.
+    Already flat chunks are returned as is, compact chunks are decoded."""
+    if "origin" in chunks:
+        return expand_chunks(chunks)
+    if "offsets" in chunks:
+        return chunks
+    points = chunks.get("points")
+    indices = chunks.get("indices")
+
+    counts = np.array([len(pos) if pos is not None else 0 for pos in points], dtype=np.int64)
+    offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+
+    flat_points = np.empty((offsets[-1], 3), dtype=np.float32)
+    flat_indices = np.empty(offsets[-1], dtype=np.int32)
+    for ic, (pos, id) in enumerate(zip(points, indices)):
+        start, end = offsets[ic], offsets[ic + 1]
+        if start == end:
+            continue
+        # Vt arrays expose the buffer protocol, this is a single memcpy
+        flat_points[start:end] = np.asarray(pos, dtype=np.float32).reshape(-1, 3)
+        flat_indices[start:end] = np.asarray(id, dtype=np.int32)
+
+    chunk_dict = dict(chunks)
+    chunk_dict["points"] = flat_points
+    chunk_dict["indices"] = flat_indices
+    chunk_dict["offsets"] = offsets
+    return chunk_dict
+
+def chunk_slice(chunks, ic):
+    """Points and indices of chunk ic, views into the world arrays when flat,
+    decoded on demand when compact"""
+    if "origin" in chunks:
+        return decode_chunk(chunks, ic)
+    if "offsets" in chunks:
+        offsets = chunks.get("offsets")
+        start, end = offsets[ic], offsets[ic + 1]
+        return chunks["points"][start:end], chunks["indices"][start:end]
+    points = np.asarray(chunks["points"][ic], dtype=np.float32).reshape(-1, 3)
+    indices = np.asarray(chunks["indices"][ic], dtype=np.int32)
+    return points, indices
+
+def new_blocks():
+    """Empty prototype table for register_blocks, the columns are lists
+    until finish_blocks"""
+    block_dict = {
+        "path": [],
+        "block": [],
+        "name": [],
+        "id": [],
+        "sub_id": [],
+        "merged": [],
+        "remap": [],
+        "lookup": {},
+    }
+    return block_dict
+
+def finish_blocks(block_dict):
+    """Prototype table with its id, sub_id and merged columns as arrays"""
+    block_dict = dict(block_dict)
+    block_dict["id"] = np.array(block_dict["id"], dtype=np.int32)
+    block_dict["sub_id"] = np.array(block_dict["sub_id"], dtype=np.int32)
+    block_dict["merged"] = np.array(block_dict["merged"], dtype=bool)
+    return block_dict
+
+def global_indices(chunks, blocks, ic=None):
+    """Global prototype index of every point, or of chunk ic only"""
+    remap = blocks.get("remap")
+    if ic is not None:
+        return remap[ic][chunk_slice(chunks, ic)[1]]
+    chunks = flatten_chunks(chunks)
+    offsets = chunks.get("offsets")
+    # Stack the remap tables and shift each chunk's local indices into its rows
+    sizes = np.array([len(r) for r in remap], dtype=np.int64)
+    starts = np.zeros(len(sizes), dtype=np.int64)
+    np.cumsum(sizes[:-1], out=starts[1:])
+    flat_remap = np.concatenate(remap) if remap else np.empty(0, dtype=np.int32)
+    shift = np.repeat(starts, np.diff(offsets))
+    return flat_remap[chunks["indices"] + shift]
+
+def narrow_dtype(low, high, signed=True):
+    """Smallest integer dtype holding values from low to high"""
+    types = (np.int8, np.int16, np.int32) if signed else (np.uint8, np.uint16, np.uint32)
+    for dtype in types:
+        info = np.iinfo(dtype)
+        if info.min <= low and high <= info.max:
+            return dtype
+    return np.int64
+
+def encode_chunk(points, indices, rle=False):
+    """Chunk local integer encoding of one chunk, the arrays are narrowed
+    to the range of the chunk itself
+    'origin' : (3,) int64 smallest voxel of the chunk
+    'shift' : (3,) float32 offset of the positions from the voxel corners
+    'local' : (R,3) int8/int16 voxel offsets from origin
+    'indices' : (R,) uint8/uint16 protoIndices
+    'length' : (R,) uint8/uint16 run lengths when rle, empty for an empty
+    chunk, None without rle
+    'axis' : scan axis of the runs
+    """
+    points = np.asarray(points, dtype=np.float32).reshape(-1, 3)
+    indices = np.asarray(indices, dtype=np.int32)
+    coords = voxel_coords(points)
+    shift = np.zeros(3, dtype=np.float32)
+    if len(points):
+        fraction = points - coords
+        shift = fraction[0]
+        if not np.allclose(fraction, shift, atol=1e-4):
+            raise ValueError("Chunk positions are not on a voxel grid")
+    origin = coords.min(axis=0) if len(coords) else np.zeros(3, dtype=np.int64)
+    local = coords - origin
+    length = np.zeros(0, dtype=np.int64) if rle else None
+    axis = 0
+    if rle and len(points):
+        # A run continues while the next point is the next voxel along the
+        # axis with the same block, the axis with the fewest runs wins
+        step = np.diff(local, axis=0)
+        same = indices[1:] == indices[:-1]
+        best = None
+        for a in range(3):
+            unit = np.zeros(3, dtype=np.int64)
+            unit[a] = 1
+            starts = np.flatnonzero(np.concatenate(([True], ~(same & (step == unit).all(axis=1)))))
+            if best is None or len(starts) < len(best):
+                best, axis = starts, a
+        length = np.diff(np.append(best, len(points)))
+        local = local[best]
+        indices = indices[best]
+    chunk = {
+        "origin": origin,
+        "shift": shift,
+        "local": local.astype(narrow_dtype(0, local.max(initial=0))),
+        "indices": indices.astype(narrow_dtype(0, indices.max(initial=0), signed=False)),
+        "length": length.astype(narrow_dtype(0, length.max(initial=0), signed=False)) if length is not None else None,
+        "axis": axis,
+    }
+    return chunk
+
+def pack_chunks(chunks, encoded, rle=False):
+    """Concatenate encoded chunks into the compact world table, every array
+    in the narrowest dtype that holds it
+    'origin' : (C,3) int32 smallest voxel of every chunk
+    'shift' : (3,) float32 offset of the positions from the voxel corners
+    'local' : (R,3) int8/int16 voxel offsets from the chunk origin
+    'indices' : (R,) uint8/uint16 protoIndices
+    'offsets' : (C+1,) int64 start of each chunk in the points
+    with rle the local and indices rows are runs along a scan axis:
+    'runs' : (C+1,) int64 start of each chunk in the runs
+    'length' : (R,) uint8/uint16 points in every run
+    'axis' : (C,) uint8 scan axis of every chunk
+    """
+    shift = next((e["shift"] for e in encoded if len(e["local"])), np.zeros(3, dtype=np.float32))
+    for e in encoded:
+        if len(e["local"]) and not np.allclose(e["shift"], shift, atol=1e-4):
+            raise ValueError("Chunks are not on a common voxel grid")
+
+    def concat(key, width=None):
+        parts = [e[key] for e in encoded]
+        empty = np.zeros((0,) + ((width,) if width else ()), dtype=np.uint8)
+        return np.concatenate(parts) if parts else empty
+
+    local = concat("local", 3)
+    indices = concat("indices")
+    origin = np.array([e["origin"] for e in encoded], dtype=np.int64).reshape(-1, 3)
+    chunk_dict = {
+        "chunks": chunks.get("chunks"),
+        "path": chunks.get("path"),
+        "origin": origin.astype(np.int32),
+        "shift": np.asarray(shift, dtype=np.float32),
+        "local": local.astype(narrow_dtype(0, local.max(initial=0))),
+        "indices": indices.astype(narrow_dtype(0, indices.max(initial=0), signed=False)),
+    }
+    rows = np.array([len(e["local"]) for e in encoded], dtype=np.int64)
+    if rle:
+        length = concat("length")
+        counts = np.array([e["length"].sum() for e in encoded], dtype=np.int64)
+        runs = np.zeros(len(rows) + 1, dtype=np.int64)
+        np.cumsum(rows, out=runs[1:])
+        chunk_dict["runs"] = runs
+        chunk_dict["length"] = length.astype(narrow_dtype(0, length.max(initial=0), signed=False))
+        chunk_dict["axis"] = np.array([e["axis"] for e in encoded], dtype=np.uint8)
+    else:
+        counts = rows
+    offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    chunk_dict["offsets"] = offsets
+    return chunk_dict
+
+def compact_chunks(chunks, rle=False):
+    """Compact encoding of read_chunk tables, flat or per chunk lists.
+    Positions become a per chunk origin plus small integer offsets and
+    the protoIndices are narrowed to the palette, float positions are only
+    produced again by chunk_slice or flatten_chunks."""
+    encoded = [encode_chunk(*chunk_slice(chunks, ic), rle) for ic in range(len(chunks.get("chunks")))]
+    return pack_chunks(chunks, encoded, rle)
+
+def decode_chunk(chunks, ic):
+    """Float32 positions and int32 protoIndices of one compact chunk"""
+    if "runs" in chunks:
+        start, end = chunks["runs"][ic], chunks["runs"][ic + 1]
+        length = chunks["length"][start:end].astype(np.int64)
+        local = np.repeat(chunks["local"][start:end].astype(np.int64), length, axis=0)
+        indices = np.repeat(chunks["indices"][start:end], length)
+        # Position of every point inside its run
+        step = np.arange(len(local)) - np.repeat(np.cumsum(length) - length, length)
+        local[:, chunks["axis"][ic]] += step
+    else:
+        start, end = chunks["offsets"][ic], chunks["offsets"][ic + 1]
+        local = chunks["local"][start:end]
+        indices = chunks["indices"][start:end]
+    points = (local + chunks["origin"][ic]).astype(np.float32) + chunks["shift"]
+    return points, indices.astype(np.int32)
+
+def expand_chunks(chunks):
+    """Flat read_chunk tables with float positions from compact chunks"""
+    offsets = chunks.get("offsets")
+    points = np.empty((offsets[-1], 3), dtype=np.float32)
+    indices = np.empty(offsets[-1], dtype=np.int32)
+    for ic in range(len(offsets) - 1):
+        points[offsets[ic]:offsets[ic + 1]], indices[offsets[ic]:offsets[ic + 1]] = decode_chunk(chunks, ic)
+    chunk_dict = {
+        "chunks": chunks.get("chunks"),
+        "path": chunks.get("path"),
+        "points": points,
+        "indices": indices,
+        "offsets": offsets,
+    }
+    return chunk_dict
+
+def voxel_coords(points):
+    """Integer voxel coordinate of Mineways positions"""
+    return np.floor(np.asarray(points, dtype=np.float64) + 1e-4).astype(np.int64)
@@ -0,0 +1,432 @@
+"""Greedy meshing and LOD layers written next to the export"""
+import os
+import numpy as np
+from pxr import Usd, UsdGeom, UsdShade, Sdf, Vt
+from .chunks import flatten_chunks, global_indices, voxel_coords
+from .usd import voxelmap_path
+from .voxel import NEIGHBOURS, TRANSPARENT_BLOCKS, voxel_grid, voxel_neighbours
+
+def new_layer(out_path):
+    """Empty layer for out_path. A layer still open at that path, from an
+    earlier write or a stage holding it, is cleared instead of created again."""
+    layer = Sdf.Layer.Find(out_path)
+    if layer is None:
+        return Sdf.Layer.CreateNew(out_path)
+    layer.Clear()
+    return layer
+
+def relative_asset(file_path, layer_dir):
+    """Asset path of file_path relative to a layer in layer_dir, anchored
+    with './' so it resolves next to the layer rather than on the search
+    path. Absolute when there is no relative path, as across drives."""
+    try:
+        relative = os.path.relpath(file_path, layer_dir).replace(os.sep, '/')
+    except ValueError:
+        return os.path.abspath(file_path).replace(os.sep, '/')
+    return relative if relative.startswith('../') else './' + relative
+
+def rebase_arcs(src_layer, dst_layer):
+    """Make the relative reference and payload asset paths copied from
+    src_layer resolve from the directory of dst_layer"""
+    dst_dir = os.path.dirname(dst_layer.realPath)
+    if dst_dir == os.path.dirname(src_layer.realPath):
+        return
+
+    def rebase(asset_path):
+        if not asset_path or os.path.isabs(asset_path) or ':' in asset_path:
+            return asset_path
+        return relative_asset(src_layer.ComputeAbsolutePath(asset_path), dst_dir)
+
+    def visit(spec_path):
+        if not spec_path.IsPrimPath() and not spec_path.IsPrimVariantSelectionPath():
+            return
+        prim_spec = dst_layer.GetPrimAtPath(spec_path)
+        if prim_spec.hasReferences:
+            prim_spec.referenceList.ModifyItemEdits(lambda ref: Sdf.Reference(
+                rebase(ref.assetPath), ref.primPath, ref.layerOffset, ref.customData))
+        if prim_spec.hasPayloads:
+            prim_spec.payloadList.ModifyItemEdits(lambda payload: Sdf.Payload(
+                rebase(payload.assetPath), payload.primPath, payload.layerOffset))
+    dst_layer.Traverse(Sdf.Path.absoluteRootPath, visit)
+
+def copy_world_layer(src_layer, dst_layer, world_path, chunks=False):
+    """Copy the root layer specs into dst_layer, the chunks under the
+    VoxelMap are skipped unless chunks is True. Relative BlockLib
+    references are rebased when dst_layer is in another directory."""
+    for key in src_layer.pseudoRoot.ListInfoKeys():
+        dst_layer.pseudoRoot.SetInfo(key, src_layer.pseudoRoot.GetInfo(key))
+    world_path = Sdf.Path(world_path)
+
+    stack = [(prim_spec, dst_layer.pseudoRoot) for prim_spec in reversed(src_layer.rootPrims)]
+    while stack:
+        src_spec, dst_parent = stack.pop()
+        if chunks or not world_path.HasPrefix(src_spec.path):
+            Sdf.CopySpec(src_layer, src_spec.path, dst_layer, src_spec.path)
+            continue
+        # An ancestor of the chunks, copied without its children
+        dst_spec = Sdf.PrimSpec(dst_parent, src_spec.name, src_spec.specifier, src_spec.typeName)
+        for key in src_spec.ListInfoKeys():
+            if key not in ('specifier', 'typeName'):
+                dst_spec.SetInfo(key, src_spec.GetInfo(key))
+        for prop in src_spec.properties:
+            Sdf.CopySpec(src_layer, prop.path, dst_layer, prop.path)
+        stack.extend((child, dst_spec) for child in reversed(src_spec.nameChildren)
+                     if src_spec.path != world_path or 'Chunk' not in child.name)
+    rebase_arcs(src_layer, dst_layer)
+    return dst_layer
+
+def block_faces(usd_paths, blocks, meshes):
+    """Face table of the global prototypes for greedy meshing
+    'material' : (P,6) int32 material of the face toward NEIGHBOURS[d],
+    -1 when the block has no full face there
+    'cube' : bool, the block is a unit cube with 6 full single material faces
+    'origin' : (P,3) float32 minimum corner of the block geometry
+    'uv' : (P,6) uint8 st layout of the face toward NEIGHBOURS[d], see uv_layout
+    """
+    stage = usd_paths.get("stage")
+    lookup = meshes.get("lookup")
+    count = len(blocks.get("path"))
+    material = np.full((count, len(NEIGHBOURS)), -1, dtype=np.int32)
+    cube = np.zeros(count, dtype=bool)
+    origin = np.zeros((count, 3), dtype=np.float32)
+    uv = np.zeros((count, len(NEIGHBOURS)), dtype=np.uint8)
+    for ib, block in enumerate(blocks.get("path")):
+        faces = []
+        for mesh in stage.GetPrimAtPath(block).GetChildren():
+            verts = mesh.GetAttribute('points').Get()
+            face_counts = mesh.GetAttribute('faceVertexCounts').Get()
+            face_indices = mesh.GetAttribute('faceVertexIndices').Get()
+            if not verts or not face_counts or face_indices is None:
+                continue
+            binding = mesh.GetRelationship('material:binding')
+            targets = binding.GetTargets() if binding else []
+            mat = lookup.get(targets[0], -1) if targets else -1
+            verts = np.asarray(verts, dtype=np.float64).reshape(-1, 3)
+            st, interpolation = None, None
+            primvar = UsdGeom.PrimvarsAPI(mesh).GetPrimvar('st')
+            if primvar and primvar.HasValue():
+                st = np.asarray(primvar.ComputeFlattened(), dtype=np.float64).reshape(-1, 2)
+                interpolation = primvar.GetInterpolation()
+            split = np.cumsum(np.asarray(face_counts))[:-1]
+            corner = 0
+            for face in np.split(np.asarray(face_indices), split):
+                face_st = None
+                if interpolation == UsdGeom.Tokens.faceVarying:
+                    face_st = st[corner:corner + len(face)]
+                elif interpolation in (UsdGeom.Tokens.vertex, UsdGeom.Tokens.varying):
+                    face_st = st[face]
+                corner += len(face)
+                faces.append((verts[face], mat, face_st))
+        if not faces:
+            continue
+        lo = np.min([f[0].min(axis=0) for f in faces], axis=0)
+        hi = np.max([f[0].max(axis=0) for f in faces], axis=0)
+        origin[ib] = lo
+        area = np.zeros(len(NEIGHBOURS))
+        solid = bool(np.allclose(hi - lo, 1, atol=1e-3))
+        for face, mat, face_st in faces:
+            size = face.max(axis=0) - face.min(axis=0)
+            axis = np.nonzero(size < 1e-4)[0]
+            if len(axis) != 1:
+                solid = False
+                continue
+            a = axis[0]
+            if abs(face[0, a] - hi[a]) < 1e-4:
+                d = 2 * a
+            elif abs(face[0, a] - lo[a]) < 1e-4:
+                d = 2 * a + 1
+            else:
+                solid = False # inside the block, like cross shaped plants
+                continue
+            if mat < 0 or material[ib, d] not in (-1, mat):
+                solid = False
+            material[ib, d] = mat
+            if face_st is not None and len(face_st) == len(face):
+                uv[ib, d] = uv_layout(face, face_st, a)
+            area[d] += np.prod(np.delete(size, a))
+        cube[ib] = solid and bool(np.allclose(area, 1, atol=1e-3))
+        if not cube[ib]:
+            material[ib] = -1
+    face_dict = {
+        "material": material,
+        "cube": cube,
+        "origin": origin,
+        "uv": uv,
+    }
+    return face_dict
+
+def uv_layout(face, face_st, a):
+    """st layout of a face whose normal is axis a, from the st gradient
+    over its two other axes u = (a+1)%3 and v = (a+2)%3.
+    bit 0 : s runs along v, t along u
+    bit 1 : s decreases along its axis
+    bit 2 : t decreases along its axis
+    """
+    plane = face[:, [(a + 1) % 3, (a + 2) % 3]]
+    plane = plane - plane.mean(axis=0)
+    grad = np.linalg.lstsq(plane, face_st - face_st.mean(axis=0), rcond=None)[0]
+    # grad[i, c] is the change of st component c along in plane axis i
+    s_on_v = abs(grad[1, 0]) > abs(grad[0, 0])
+    s_axis, t_axis = (1, 0) if s_on_v else (0, 1)
+    return int(s_on_v) | int(grad[s_axis, 0] < 0) << 1 | int(grad[t_axis, 1] < 0) << 2
+
+def greedy_quads(coords, face_material, face_uv=None):
+    """Merge the visible faces of a set of voxels into quads, runs of equal
+    material along v are merged first then identical runs along u.
+    coords : (M,3) int voxel coordinates
+    face_material : (M,6) material of the face toward NEIGHBOURS[d], -1 hidden
+    face_uv : (M,6) st layout of the faces, see uv_layout, only faces with
+    the same material and layout are merged
+    'direction' : index into NEIGHBOURS of the quad normal
+    'plane' : voxel coordinate along the normal axis
+    'u0','u1','v0','v1' : voxel span of the quad on the two other axes,
+    u is axis (a+1)%3 and v is axis (a+2)%3
+    'material' : material of the quad
+    'uv' : st layout of the quad
+    """
+    quads = {k: [] for k in ("direction", "plane", "u0", "u1", "v0", "v1", "material", "uv")}
+    for d in range(len(NEIGHBOURS)):
+        visible = np.nonzero(face_material[:, d] >= 0)[0]
+        if not len(visible):
+            continue
+        a = d // 2
+        s = coords[visible, a]
+        u = coords[visible, (a + 1) % 3]
+        v = coords[visible, (a + 2) % 3]
+        # The layout rides along in the low bits of the merge key
+        m = face_material[visible, d].astype(np.int64) * 8
+        if face_uv is not None:
+            m += face_uv[visible, d]
+
+        # Runs along v of the same slice, material and row
+        order = np.lexsort((v, u, m, s))
+        s, u, v, m = s[order], u[order], v[order], m[order]
+        start = np.ones(len(s), dtype=bool)
+        start[1:] = (s[1:] != s[:-1]) | (m[1:] != m[:-1]) | (u[1:] != u[:-1]) | (v[1:] != v[:-1] + 1)
+        first = np.nonzero(start)[0]
+        last = np.append(first[1:], len(s)) - 1
+        rs, ru, rm = s[first], u[first], m[first]
+        rv0, rv1 = v[first], v[last] + 1
+
+        # Stack identical runs of consecutive rows
+        order = np.lexsort((ru, rv1, rv0, rm, rs))
+        rs, ru, rm, rv0, rv1 = rs[order], ru[order], rm[order], rv0[order], rv1[order]
+        start = np.ones(len(rs), dtype=bool)
+        start[1:] = ((rs[1:] != rs[:-1]) | (rm[1:] != rm[:-1]) | (rv0[1:] != rv0[:-1])
+                     | (rv1[1:] != rv1[:-1]) | (ru[1:] != ru[:-1] + 1))
+        first = np.nonzero(start)[0]
+        last = np.append(first[1:], len(rs)) - 1
+
+        quads["direction"].append(np.full(len(first), d, dtype=np.int64))
+        quads["plane"].append(rs[first])
+        quads["u0"].append(ru[first])
+        quads["u1"].append(ru[last] + 1)
+        quads["v0"].append(rv0[first])
+        quads["v1"].append(rv1[first])
+        quads["material"].append(rm[first] // 8)
+        quads["uv"].append(rm[first] % 8)
+    return {k: np.concatenate(v) if v else np.empty(0, dtype=np.int64) for k, v in quads.items()}
+
+def quad_geometry(quads, origin=(0, 0, 0)):
+    """Corner points, faceVarying st and normals of greedy quads, 4 corners
+    per quad wound counter clockwise around the outward normal. The st
+    coordinates count blocks so a repeating texture tiles once per block,
+    laid out along the quad axes as its 'uv' says, see uv_layout."""
+    d = quads.get("direction")
+    a = d // 2
+    positive = (d % 2) == 0
+    corners_uv = np.array([(0, 0), (1, 0), (1, 1), (0, 1)])
+    # Negative faces walk the corners the other way round
+    corners = np.where(positive[:, None], np.arange(4)[None], np.arange(4)[::-1][None])
+    cu = corners_uv[corners, 0]
+    cv = corners_uv[corners, 1]
+    u = np.where(cu, quads["u1"][:, None], quads["u0"][:, None])
+    v = np.where(cv, quads["v1"][:, None], quads["v0"][:, None])
+    plane = quads["plane"] + positive
+
+    axes = np.empty((len(d), 3, 4), dtype=np.float64)
+    rows = np.arange(len(d))
+    axes[rows, a] = plane[:, None]
+    axes[rows, (a + 1) % 3] = u
+    axes[rows, (a + 2) % 3] = v
+    points = axes.transpose(0, 2, 1) + np.asarray(origin, dtype=np.float64)
+
+    layout = quads.get("uv")
+    if layout is None:
+        layout = np.zeros(len(d), dtype=np.int64)
+    layout = layout[:, None]
+    span_u = (quads["u1"] - quads["u0"])[:, None]
+    span_v = (quads["v1"] - quads["v0"])[:, None]
+    # Blocks along the axis of s and t, counted back where they decrease
+    s_on_v = (layout & 1) > 0
+    s_span = np.where(s_on_v, span_v, span_u)
+    t_span = np.where(s_on_v, span_u, span_v)
+    s = np.where(s_on_v, cv, cu) * s_span
+    t = np.where(s_on_v, cu, cv) * t_span
+    s = np.where(layout & 2, s_span - s, s)
+    t = np.where(layout & 4, t_span - t, t)
+    st = np.stack([s, t], axis=-1)
+    normals = np.repeat(NEIGHBOURS[d][:, None], 4, axis=1)
+    return (points.reshape(-1, 3).astype(np.float32), st.reshape(-1, 2).astype(np.float32),
+            normals.reshape(-1, 3).astype(np.float32))
+
+def write_greedy_layer(paths, usd_paths, chunks, blocks, meshes, out_path=None, transparent=TRANSPARENT_BLOCKS):
+    """Convert the chunks into greedy meshed UsdGeom.Mesh prims, one per
+    chunk and material, under /<world>/GreedyMesh. Blocks that are not
+    full cubes stay in the chunk PointInstancers. Merged quads tile their
+    st past 1, so the bound textures are set to repeat. The layer loads
+    directly in Blender's USD importer."""
+    chunks = flatten_chunks(chunks)
+    world_path = voxelmap_path(paths)
+    if out_path is None:
+        out_path = os.path.join(os.path.dirname(paths.get("file_path")), paths.get("file_name") + '_greedy.usda')
+
+    faces = block_faces(usd_paths, blocks, meshes)
+    cube = faces.get("cube")
+    names = blocks.get("name")
+    clear = np.array([any(t in str(n or '').lower() for t in transparent) for n in names], dtype=bool)
+    # Neighbours that hide a face: full cubes you cannot see through
+    hiding = cube & ~clear
+    origin = faces["origin"][cube][0] if cube.any() else np.zeros(3, dtype=np.float32)
+
+    proto = global_indices(chunks, blocks)
+    grid = voxel_grid(chunks)
+    neighbour = voxel_neighbours(grid, proto).get("block")
+    face_material = faces["material"][proto]
+    face_material[(neighbour >= 0) & hiding[np.maximum(neighbour, 0)]] = -1
+    face_uv = faces["uv"][proto]
+    meshed = cube[proto]
+
+    src_layer = usd_paths.get("stage").GetRootLayer()
+    layer = new_layer(out_path)
+    copy_world_layer(src_layer, layer, world_path)
+    stage = Usd.Stage.Open(layer)
+    mesh_root = world_path.rsplit('/', 1)[0] + '/GreedyMesh'
+    UsdGeom.Scope.Define(stage, mesh_root)
+
+    material_paths = meshes.get("material")
+    bound = set()
+    offsets = chunks.get("offsets")
+    for ic, chunk_name in enumerate(chunks.get("chunks")):
+        start, end = offsets[ic], offsets[ic + 1]
+        keep = ~meshed[start:end]
+        if keep.any():
+            instancer = UsdGeom.PointInstancer.Define(stage, world_path + chunk_name)
+            instancer.CreatePrototypesRel().SetTargets(chunks["path"][ic])
+            instancer.CreatePositionsAttr(Vt.Vec3fArray.FromNumpy(
+                np.ascontiguousarray(chunks["points"][start:end][keep], dtype=np.float32)))
+            instancer.CreateProtoIndicesAttr(Vt.IntArray.FromNumpy(
+                np.ascontiguousarray(chunks["indices"][start:end][keep], dtype=np.int32)))
+
+        cubes = np.nonzero(meshed[start:end])[0] + start
+        quads = greedy_quads(grid["coords"][cubes], face_material[cubes], face_uv[cubes])
+        if not len(quads["direction"]):
+            continue
+        chunk_path = mesh_root + chunk_name
+        UsdGeom.Xform.Define(stage, chunk_path)
+        points, st, normals = quad_geometry(quads, origin)
+        corner = np.repeat(quads["material"], 4)
+        for mat in np.unique(quads["material"]):
+            select = corner == mat
+            mat_path = material_paths[mat]
+            mesh = UsdGeom.Mesh.Define(stage, chunk_path + '/' + mat_path.name)
+            mat_points = points[select]
+            mesh.CreatePointsAttr(Vt.Vec3fArray.FromNumpy(mat_points))
+            mesh.CreateFaceVertexCountsAttr(Vt.IntArray.FromNumpy(np.full(len(mat_points) // 4, 4, dtype=np.int32)))
+            mesh.CreateFaceVertexIndicesAttr(Vt.IntArray.FromNumpy(np.arange(len(mat_points), dtype=np.int32)))
+            mesh.CreateNormalsAttr(Vt.Vec3fArray.FromNumpy(normals[select]))
+            mesh.SetNormalsInterpolation(UsdGeom.Tokens.faceVarying)
+            mesh.CreateExtentAttr(Vt.Vec3fArray.FromNumpy(
+                np.stack([mat_points.min(axis=0), mat_points.max(axis=0)])))
+            primvar = UsdGeom.PrimvarsAPI(mesh).CreatePrimvar(
+                'st', Sdf.ValueTypeNames.TexCoord2fArray, UsdGeom.Tokens.faceVarying)
+            primvar.Set(Vt.Vec2fArray.FromNumpy(st[select]))
+            UsdShade.MaterialBindingAPI.Apply(mesh.GetPrim()).Bind(
+                UsdShade.Material(stage.GetPrimAtPath(mat_path)))
+            bound.add(mat_path)
+
+    for mat_path in sorted(bound):
+        for prim in Usd.PrimRange(stage.GetPrimAtPath(mat_path)):
+            shader = UsdShade.Shader(prim)
+            if shader and shader.GetShaderId() == 'UsdUVTexture':
+                for name in ('wrapS', 'wrapT'):
+                    shader.CreateInput(name, Sdf.ValueTypeNames.Token).Set('repeat')
+    layer.Save()
+    return out_path
+
+def lod_cells(coords, labels, factor):
+    """Downsample voxels by factor, a cell keeps the most common label of
+    its voxels when at least half of them are occupied. Cells are aligned
+    to world multiples of factor so neighbouring chunks line up.
+    Returns the minimum voxel coordinate and the label of every kept cell."""
+    if not len(coords):
+        return np.empty((0, 3), dtype=np.int64), np.empty(0, dtype=labels.dtype)
+    base = (coords.min(axis=0) // factor) * factor
+    local = coords - base
+    cells = (local.max(axis=0) // factor) + 1
+    shape = cells * factor
+
+    occupied = np.zeros(shape, dtype=bool)
+    occupied[local[:, 0], local[:, 1], local[:, 2]] = True
+    count = occupied.reshape(cells[0], factor, cells[1], factor, cells[2], factor).sum(axis=(1, 3, 5))
+
+    # Majority vote of the labels in each cell
+    cell = local // factor
+    cell_id = (cell[:, 0] * cells[1] + cell[:, 1]) * cells[2] + cell[:, 2]
+    label_count = int(labels.max()) + 1
+    votes = np.bincount(cell_id * label_count + labels, minlength=int(cells.prod()) * label_count)
+    winner = votes.reshape(-1, label_count).argmax(axis=1)
+
+    keep = np.nonzero(count.ravel() * 2 >= factor ** 3)[0]
+    keep_cells = np.stack(np.unravel_index(keep, cells), axis=1)
+    return base + keep_cells * factor, winner[keep].astype(labels.dtype)
+
+def write_lod_layer(paths, usd_paths, chunks, blocks, meshes, factors=(2, 4, 8), out_path=None):
+    """Author a 'lod' variant set on every chunk in a layer referencing the
+    export. Variant 'full' is the default and keeps the chunk untouched,
+    'x2', 'x4', ... replace the instances by blocks scaled to fill each cell."""
+    chunks = flatten_chunks(chunks)
+    world_path = voxelmap_path(paths)
+    if out_path is None:
+        out_path = os.path.join(os.path.dirname(paths.get("file_path")), paths.get("file_name") + '_lod.usda')
+    origin = block_faces(usd_paths, blocks, meshes).get("origin")
+    coords = voxel_coords(chunks.get("points"))
+
+    # The world is referenced rather than sublayered, a variant is weaker
+    # than local opinions but stronger than a reference
+    src_layer = usd_paths.get("stage").GetRootLayer()
+    layer = new_layer(out_path)
+    for key in src_layer.pseudoRoot.ListInfoKeys():
+        layer.pseudoRoot.SetInfo(key, src_layer.pseudoRoot.GetInfo(key))
+    root_path = Sdf.Path(world_path).GetPrefixes()[0]
+    root_spec = Sdf.CreatePrimInLayer(layer, root_path)
+    root_spec.specifier = Sdf.SpecifierDef
+    export_asset = relative_asset(paths.get("file_path"), os.path.dirname(os.path.abspath(out_path)))
+    root_spec.referenceList.Prepend(Sdf.Reference(export_asset, root_path))
+    offsets = chunks.get("offsets")
+    for ic, chunk_name in enumerate(chunks.get("chunks")):
+        start, end = offsets[ic], offsets[ic + 1]
+        prim_spec = Sdf.CreatePrimInLayer(layer, world_path + chunk_name)
+        prim_spec.specifier = Sdf.SpecifierOver
+        variant_set = Sdf.VariantSetSpec(prim_spec, 'lod')
+        Sdf.VariantSpec(variant_set, 'full')
+        labels = chunks["indices"][start:end]
+        for factor in factors:
+            cell, label = lod_cells(coords[start:end], labels, factor)
+            proto_origin = origin[blocks["remap"][ic][label]] if len(label) else np.zeros((0, 3))
+            # A prototype scaled about the instance origin covers the cell
+            pos = cell + proto_origin * (1 - factor)
+            variant = Sdf.VariantSpec(variant_set, 'x%d' % factor).primSpec
+            for name, type_name, value in (
+                ('positions', Sdf.ValueTypeNames.Point3fArray,
+                 Vt.Vec3fArray.FromNumpy(np.ascontiguousarray(pos, dtype=np.float32))),
+                ('protoIndices', Sdf.ValueTypeNames.IntArray,
+                 Vt.IntArray.FromNumpy(np.ascontiguousarray(label, dtype=np.int32))),
+                ('scales', Sdf.ValueTypeNames.Float3Array,
+                 Vt.Vec3fArray.FromNumpy(np.full((len(label), 3), factor, dtype=np.float32))),
+            ):
+                Sdf.AttributeSpec(variant, name, type_name).default = value
+        prim_spec.variantSetNameList.Prepend('lod')
+        prim_spec.variantSelections['lod'] = 'full'
+    layer.Save()
+    return out_path
@@ -0,0 +1,34 @@
+"""Chunk hashes for incremental re-imports"""
+import hashlib
+import numpy as np
+from .chunks import chunk_slice
+
+def chunk_hashes(chunks, blocks=None):
+    """Content hash of every chunk from its positions, protoIndices and
+    prototype targets. With blocks the global index of every prototype is
+    hashed too, a chunk built against the global table (shared node group)
+    is out of date when another chunk shifts that table."""
+    hashes = []
+    for ic, targets in enumerate(chunks.get("path")):
+        points, indices = chunk_slice(chunks, ic)
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(np.ascontiguousarray(points, dtype=np.float32).tobytes())
+        digest.update(np.ascontiguousarray(indices, dtype=np.int32).tobytes())
+        digest.update('\n'.join(str(t) for t in targets).encode())
+        if blocks is not None:
+            digest.update(np.ascontiguousarray(blocks["remap"][ic], dtype=np.int32).tobytes())
+        hashes.append(digest.hexdigest())
+    return hashes
+
+def diff_chunks(previous, names, hashes):
+    """Compare the chunk hashes of a previous import with the new ones
+    'added', 'removed', 'modified', 'unchanged' : lists of chunk names
+    """
+    current = dict(zip(names, hashes))
+    diff_dict = {
+        "added": [n for n in names if n not in previous],
+        "removed": [n for n in previous if n not in current],
+        "modified": [n for n in names if n in previous and previous[n] != current[n]],
+        "unchanged": [n for n in names if previous.get(n) == current[n]],
+    }
+    return diff_dict
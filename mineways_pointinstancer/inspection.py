@@ -0,0 +1,71 @@
+"""Sdf only report of an export"""
+import time
+from .usd import block_names, index_chunks
+
+def inspect_world(paths, names=False):
+    """Report of an export from the root layer specs alone: instance counts
+    by block, by id and nbt, per chunk bounds and totals, in seconds even
+    on exports too big to import
+    names : also read the block typeNames, this opens the whole
+    BlockLibrary layer, meshes included
+    'chunks' : chunk count
+    'instances' : total point count
+    'bounds' : world min and max
+    'prototypes' : distinct prototypes targeted by the chunks
+    'unused_prototypes' : prototypes targeted but never instanced
+    'blocks' : per prototype block, id, sub_id, name, count and chunks using
+    it, name is None without names
+    'ids' : instance count by block id, all nbt ids together
+    'per_chunk' : name, count, min, max and prototypes of every chunk
+    """
+    then = time.time()
+    index = index_chunks(paths, counts=True, prototypes=True)
+    if index is None:
+        raise ValueError("No VoxelMap in the root layer of " + paths.get("file_path"))
+    type_names = block_names(paths) if names else {}
+
+    usage = {}
+    for targets, counts in zip(index["path"], index["usage"]):
+        for target, count in zip(targets, counts[:len(targets)]):
+            entry = usage.setdefault(target.name, [0, 0])
+            entry[0] += int(count)
+            entry[1] += int(count > 0)
+    blocks = []
+    ids = {}
+    for block_name, (count, chunk_count) in usage.items():
+        id = block_name.split("Block_")[1].split('_')
+        blocks.append({
+            "block": block_name,
+            "id": int(id[0]),
+            "sub_id": int(id[1]),
+            "name": type_names.get(block_name),
+            "count": count,
+            "chunks": chunk_count,
+        })
+        ids[int(id[0])] = ids.get(int(id[0]), 0) + count
+    blocks.sort(key=lambda b: (-b["count"], b["id"], b["sub_id"]))
+
+    lo, hi = index["min"], index["max"]
+    report = {
+        "file_path": paths.get("file_path"),
+        "world_name": paths.get("world_name"),
+        "chunks": len(index["chunks"]),
+        "instances": int(index["count"].sum()),
+        "bounds": {
+            "min": lo.min(axis=0).tolist() if len(lo) else None,
+            "max": hi.max(axis=0).tolist() if len(hi) else None,
+        },
+        "prototypes": len(blocks),
+        "unused_prototypes": sum(1 for b in blocks if not b["count"]),
+        "blocks": blocks,
+        "ids": dict(sorted(ids.items())),
+        "per_chunk": [{
+            "chunk": name,
+            "count": int(count),
+            "min": lo[ic].tolist(),
+            "max": hi[ic].tolist(),
+            "prototypes": len(index["path"][ic]),
+        } for ic, (name, count) in enumerate(zip(index["chunks"], index["count"]))],
+        "seconds": time.time() - then,
+    }
+    return report
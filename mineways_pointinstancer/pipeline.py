@@ -0,0 +1,170 @@
+"""The whole import, the pxr stages then the Blender ones when bpy is there"""
+import time
+import numpy as np
+from .cache import load_cache, save_cache
+from .chunks import compact_chunks
+from .incremental import chunk_hashes, diff_chunks
+from .prune import write_pruned_library
+from .report import chunk_counters, mesh_counters, new_report, report_stage, write_report
+from .textures import write_texture_layer
+from .usd import read_block, read_chunk, read_chunk_parallel, read_mesh, read_path, read_usd
+from .voxel import block_opacity, cull_occluded
+
+def read_world(file_path, region=None, workers=0, cull=False, cache=False, textures=None,
+               compact=False, prune=False, filters=None, report=None):
+    """Read an export into its chunk, block and mesh tables, runs anywhere
+    pxr is installed
+    region : {"box": (min, max)} or {"center": (x,y,z), "radius": r}
+    workers : decode the chunks on a process pool, plain Python only
+    cull : drop blocks buried under opaque blocks
+    cache : keep the decoded tables next to the export
+    textures : 'dedupe' or 'atlas', import through a layer with shared textures
+    compact : hold the chunks as small integers, float positions only per chunk
+    prune : import a BlockLibrary pruned to the blocks the chunks use
+    filters : block filters, e.g. {"exclude": {"name": ["*leaves*", "water"]}}
+    Returns a dict of 'paths', 'usd_paths', 'chunks', 'blocks', 'meshes',
+    'report' and 'import_path', the layer Blender should import.
+    usd_paths is None when the tables came from the cache and no stage was
+    needed to write the layers
+    """
+    paths = read_path(file_path)
+    import_path = None
+    usd_paths = None
+    if report is None:
+        report = new_report(paths)
+    options = {"region": region, "cull": cull, "filters": filters}
+    cached = None
+    if cache:
+        with report_stage(report, "load_cache") as counters:
+            cached = load_cache(paths, options)
+            counters["hit"] = bool(cached)
+    if cached:
+        chunks, blocks, meshes = cached
+        if prune or textures:
+            # The layers below are written from the stage, the BlockLib is enough
+            with report_stage(report, "read_usd") as counters:
+                usd_paths = read_usd(paths, region, chunks=False)
+    else:
+        with report_stage(report, "read_usd") as counters:
+            usd_paths = read_usd(paths, region, chunks=not workers)
+            counters["chunks"] = sum('Chunk' in c.GetName() for c in usd_paths["chunk"])
+        with report_stage(report, "read_chunk") as counters:
+            if workers:
+                chunks = read_chunk_parallel(paths, workers, region, filters)
+            else:
+                # Culling needs the float positions, compact reads only without it
+                read_compact = compact and not cull
+                chunks = read_chunk(usd_paths, flat=True, compact=read_compact, rle=read_compact, filters=filters)
+            counters.update(chunk_counters(chunks))
+        with report_stage(report, "read_block") as counters:
+            blocks = read_block(usd_paths,chunks)
+            counters["prototypes"] = len(blocks["path"])
+        with report_stage(report, "read_mesh") as counters:
+            meshes = read_mesh(usd_paths,blocks)
+            counters.update(mesh_counters(meshes))
+
+        if cull:
+            with report_stage(report, "cull") as counters:
+                opaque = block_opacity(usd_paths, blocks)
+                chunks = cull_occluded(chunks, blocks, opaque)
+                counters["culled"] = chunks["culled"].sum()
+        if cache:
+            with report_stage(report, "save_cache") as counters:
+                save_cache(paths, chunks, blocks, meshes, options)
+
+    # Run on cached tables too, none of these is part of the cache
+    if compact:
+        with report_stage(report, "compact") as counters:
+            if "origin" not in chunks:
+                chunks = compact_chunks(chunks, rle=True)
+            counters["bytes"] = sum(v.nbytes for v in chunks.values() if isinstance(v, np.ndarray))
+    if prune:
+        with report_stage(report, "prune") as counters:
+            counters.update(write_pruned_library(paths, usd_paths, chunks, blocks))
+            import_path = counters["layer"]
+    if textures:
+        with report_stage(report, "textures") as counters:
+            layer_paths = dict(paths, file_path=import_path or paths.get("file_path"))
+            counters.update(write_texture_layer(layer_paths, usd_paths, meshes, textures == 'atlas'))
+            import_path = counters["layer"]
+    report["counters"] = dict(chunk_counters(chunks), prototypes=len(blocks["path"]), **mesh_counters(meshes))
+    world = {
+        "paths": paths,
+        "usd_paths": usd_paths,
+        "chunks": chunks,
+        "blocks": blocks,
+        "meshes": meshes,
+        "report": report,
+        "import_path": import_path,
+    }
+    return world
+
+def build_world(world, shared_nodegroup=False, incremental=False, clean=False):
+    """Build the tables of read_world in the open blend file
+    shared_nodegroup : one node group for all chunks instead of one per chunk
+    incremental : only rebuild the chunks that changed since the last import
+    clean : remove the collections of a previous import first
+    """
+    from . import blender
+    paths = world.get("paths")
+    chunks = world.get("chunks")
+    blocks = world.get("blocks")
+    meshes = world.get("meshes")
+    report = world.get("report")
+    if clean:
+        file_name = paths.get("file_name")
+        blender.clean_collection(blender.D.collections[file_name + " USD Collection"])
+
+    with report_stage(report, "create_asset") as counters:
+        process = blender.create_asset()
+    with report_stage(report, "create_usd_collection") as counters:
+        collections = blender.create_usd_collection(paths, report, world.get("import_path"))
+    only = None
+    # The shared node group instances by global index, so its chunks also
+    # change when the global table does
+    hashes = chunk_hashes(chunks, blocks if shared_nodegroup else None)
+    if incremental:
+        with report_stage(report, "diff_chunks") as counters:
+            diff = diff_chunks(blender.read_import_hashes(paths), chunks["chunks"], hashes)
+            blender.remove_chunks(paths, diff["removed"])
+            only = set(diff["added"] + diff["modified"])
+            counters.update({k: len(v) for k, v in diff.items()})
+
+    broke = []
+    with report_stage(report, "create_nodegroup") as counters:
+        if shared_nodegroup:
+            count = len(chunks["chunks"]) if only is None else len(only)
+            node_groups = [blender.create_shared_nodegroup(paths, blocks, meshes, process, broke)] * count
+        else:
+            node_groups = blender.create_nodegroup(chunks, blocks, meshes, process, only, broke)
+        counters["node_groups"] = len(set(node_groups))
+        counters["nodes"] = sum(len(ng.nodes) for ng in set(node_groups))
+        counters["broken_blocks"] = len(broke)
+        counters["broken"] = sorted(set(broke))
+
+    point_collection = collections[0][1]
+    with report_stage(report, "create_pts") as counters:
+        object_mesh = blender.create_pts(paths,chunks,blocks,only,hashes)
+        counters["meshes"] = len(object_mesh)
+    with report_stage(report, "create_object") as counters:
+        blender.create_object(object_mesh, point_collection, node_groups,
+                              "proto_index" if shared_nodegroup else "instance_index")
+    return world
+
+def import_world(file_path, shared_nodegroup=False, incremental=False, clean=False,
+                 report_file=None, profile_dir=None, **options):
+    """read_world, then build_world when running inside Blender. options
+    are the keyword arguments of read_world. Returns the read_world dict."""
+    then = time.time()
+    report = new_report(read_path(file_path), profile_dir)
+    world = read_world(file_path, report=report, **options)
+    try:
+        import bpy
+    except ImportError:
+        bpy = None
+    if bpy is not None:
+        build_world(world, shared_nodegroup, incremental, clean)
+    if report_file:
+        write_report(report, report_file)
+    print("It took: ", time.time() - then, " seconds")
+    return world
@@ -0,0 +1,125 @@
+"""BlockLibrary pruned to the instanced prototypes"""
+import os
+import numpy as np
+from pxr import Sdf, Vt
+from .chunks import chunk_slice, flatten_chunks, global_indices
+from .convert import copy_world_layer, new_layer, relative_asset
+from .usd import voxelmap_path
+
+# Per instance arrays of a PointInstancer, dropped when the point count changes
+INSTANCE_ATTRIBUTES = ("orientations", "scales", "velocities", "angularVelocities", "accelerations", "ids", "invisibleIds")
+
+def used_prototypes(chunks, blocks):
+    """Bool array over the prototype table, True when a point instances it"""
+    used = np.zeros(len(blocks.get("path")), dtype=bool)
+    used[global_indices(chunks, blocks)] = True
+    return used
+
+def blocklib_layer(usd_paths):
+    """The BlockLibrary layer and the BlockLib prim path inside it, from the
+    prim stack of the prim referencing it"""
+    stage = usd_paths.get("stage")
+    block_path = usd_paths.get("block_path")
+    for prim_spec in stage.GetPrimAtPath(block_path).GetPrimStack():
+        if not stage.HasLocalLayer(prim_spec.layer):
+            return prim_spec.layer, prim_spec.path
+    raise ValueError("No BlockLibrary referenced by " + block_path)
+
+def material_targets(layer, path):
+    """material:binding targets authored under path in layer"""
+    targets = set()
+
+    def visit(spec_path):
+        if spec_path.IsPropertyPath() and spec_path.name == 'material:binding':
+            targets.update(layer.GetRelationshipAtPath(spec_path).targetPathList.GetAddedOrExplicitItems())
+    layer.Traverse(path, visit)
+    return targets
+
+def write_pruned_library(paths, usd_paths, chunks, blocks, out_path=None):
+    """Write a copy of the export holding only the read chunks, with their
+    prototypes reduced to the blocks a point instances, referencing a copy
+    of the BlockLibrary pruned to those blocks and their materials. The
+    pruned library is written next to BlockLibrary.usda so its relative
+    texture paths still resolve.
+    'layer' : the pruned root layer, <file>_blocks.usda next to the export
+    'library' : the pruned BlockLibrary layer
+    'blocks', 'materials' : kept and total counts
+    """
+    chunks = flatten_chunks(chunks)
+    stage = usd_paths.get("stage")
+    world_path = voxelmap_path(paths)
+    block_path = Sdf.Path(usd_paths.get("block_path"))
+    if out_path is None:
+        out_path = os.path.join(os.path.dirname(paths.get("file_path")), paths.get("file_name") + '_blocks.usda')
+    out_dir = os.path.dirname(os.path.abspath(out_path))
+
+    # Library side, the blocks nothing instances and their unused materials go
+    lib_layer, lib_root = blocklib_layer(usd_paths)
+    lib_path = os.path.join(os.path.dirname(lib_layer.realPath), 'BlockLibrary_pruned.usda')
+    library = new_layer(lib_path)
+    library.TransferContent(lib_layer)
+    used = used_prototypes(chunks, blocks)
+    keep = set(p.ReplacePrefix(block_path, lib_root) for p, u in zip(blocks.get("path"), used) if u)
+    blocks_spec = library.GetPrimAtPath(lib_root.AppendChild('Blocks'))
+    materials = set()
+    for path in keep:
+        materials |= material_targets(library, path)
+    looks = blocks_spec.nameChildren.get('Looks')
+    edit = Sdf.BatchNamespaceEdit()
+    block_count = material_count = 0
+    for child in blocks_spec.nameChildren:
+        if child.name == 'Looks':
+            continue
+        block_count += 1
+        if child.path not in keep:
+            edit.Add(Sdf.NamespaceEdit.Remove(child.path))
+    for child in (looks.nameChildren if looks else []):
+        material_count += 1
+        if child.path not in materials:
+            edit.Add(Sdf.NamespaceEdit.Remove(child.path))
+    library.Apply(edit)
+    library.Save()
+
+    # Root side, the read chunks rewritten from the chunk table
+    layer = new_layer(out_path)
+    copy_world_layer(stage.GetRootLayer(), layer, world_path)
+    library_asset = relative_asset(lib_path, out_dir)
+    lib_spec = layer.GetPrimAtPath(block_path)
+    lib_spec.referenceList.ModifyItemEdits(
+        lambda ref: Sdf.Reference(library_asset, ref.primPath, ref.layerOffset, ref.customData)
+        if ref.assetPath and lib_layer == Sdf.Layer.FindRelativeToLayer(layer, ref.assetPath) else ref)
+
+    src_layer = stage.GetRootLayer()
+    for ic, chunk_name in enumerate(chunks.get("chunks")):
+        chunk_path = Sdf.Path(world_path + chunk_name)
+        if src_layer.GetPrimAtPath(chunk_path):
+            Sdf.CopySpec(src_layer, chunk_path, layer, chunk_path)
+        chunk_spec = Sdf.CreatePrimInLayer(layer, chunk_path)
+        chunk_spec.specifier = Sdf.SpecifierDef
+        chunk_spec.typeName = 'PointInstancer'
+        points, indices = chunk_slice(chunks, ic)
+        local = used[blocks["remap"][ic]]
+        targets = [t for t, u in zip(chunks["path"][ic], local) if u]
+        rel = chunk_spec.relationships.get('prototypes') or Sdf.RelationshipSpec(chunk_spec, 'prototypes')
+        rel.targetPathList.explicitItems = targets
+        positions = chunk_spec.attributes.get('positions')
+        if positions is None or len(positions.default or []) != len(points):
+            for name in INSTANCE_ATTRIBUTES:
+                if name in chunk_spec.attributes:
+                    chunk_spec.RemoveProperty(chunk_spec.attributes[name])
+        for name, type_name, value in (
+                ('positions', Sdf.ValueTypeNames.Point3fArray,
+                 Vt.Vec3fArray.FromNumpy(np.ascontiguousarray(points, dtype=np.float32))),
+                ('protoIndices', Sdf.ValueTypeNames.IntArray,
+                 Vt.IntArray.FromNumpy((np.cumsum(local) - 1)[indices].astype(np.int32)))):
+            attr = chunk_spec.attributes.get(name) or Sdf.AttributeSpec(chunk_spec, name, type_name)
+            attr.default = value
+    layer.Save()
+
+    summary = {
+        "layer": out_path,
+        "library": lib_path,
+        "blocks": [len(keep), block_count],
+        "materials": [len(materials), material_count],
+    }
+    return summary
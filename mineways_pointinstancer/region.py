@@ -0,0 +1,88 @@
+"""Chunks merged into region tile instancers"""
+import os
+import numpy as np
+from pxr import Sdf, Vt
+from .chunks import flatten_chunks, global_indices, voxel_coords
+from .convert import copy_world_layer, new_layer
+from .usd import voxelmap_path
+
+# Width of a Minecraft chunk in blocks
+CHUNK_SIZE = 16
+
+def region_name(tx, tz):
+    """Prim name of a region tile, it still contains 'Chunk' so read_chunk
+    picks it up, negative coordinates are written with an n"""
+    return 'RegionChunk_%s_%s' % tuple(('n%d' % -v) if v < 0 else str(v) for v in (tx, tz))
+
+def region_tiles(coords, tile=8):
+    """Group voxels into square tiles of tile x tile chunks on X and Z
+    'key' : (T,2) int64 tile coordinates
+    'order' : point order grouping the tiles, stable within a tile
+    'offsets' : (T+1,) int64 start of each tile in order
+    """
+    size = CHUNK_SIZE * tile
+    xz = np.floor_divide(np.asarray(coords)[:, [0, 2]], size)
+    key, inverse = np.unique(xz.reshape(-1, 2), axis=0, return_inverse=True)
+    inverse = inverse.reshape(-1)
+    order = np.argsort(inverse, kind='stable')
+    offsets = np.zeros(len(key) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(inverse, minlength=len(key)), out=offsets[1:])
+    tile_dict = {
+        "key": key.astype(np.int64).reshape(-1, 2),
+        "order": order,
+        "offsets": offsets,
+    }
+    return tile_dict
+
+def write_region_layer(paths, usd_paths, chunks, blocks, tile=8, out_path=None):
+    """Merge the chunks into one PointInstancer per tile x tile chunks,
+    all sharing a single prototype list of the instanced blocks, written
+    as a usdc crate, by default next to the export. The tiles are read
+    back like chunks by read_chunk.
+    'layer' : the written layer, <file>_regions.usdc by default
+    'chunks', 'regions' : chunk count before and tile count after
+    'prototypes' : size of the shared prototype list
+    """
+    chunks = flatten_chunks(chunks)
+    world_path = voxelmap_path(paths)
+    if out_path is None:
+        out_path = os.path.join(os.path.dirname(paths.get("file_path")), paths.get("file_name") + '_regions.usdc')
+
+    # Global prototype index of every point, narrowed to the used blocks
+    proto = global_indices(chunks, blocks)
+    used, proto = np.unique(proto, return_inverse=True)
+    targets = [blocks["path"][i] for i in used]
+    points = chunks.get("points")
+    coords = voxel_coords(points)
+    tiles = region_tiles(coords, tile)
+
+    layer = new_layer(out_path)
+    copy_world_layer(usd_paths.get("stage").GetRootLayer(), layer, world_path)
+    order = tiles.get("order")
+    offsets = tiles.get("offsets")
+    for it, (tx, tz) in enumerate(tiles.get("key")):
+        select = order[offsets[it]:offsets[it + 1]]
+        prim_spec = Sdf.CreatePrimInLayer(layer, world_path + '/' + region_name(tx, tz))
+        prim_spec.specifier = Sdf.SpecifierDef
+        prim_spec.typeName = 'PointInstancer'
+        rel = Sdf.RelationshipSpec(prim_spec, 'prototypes')
+        rel.targetPathList.explicitItems = targets
+        tile_coords = coords[select]
+        for name, type_name, value in (
+                ('positions', Sdf.ValueTypeNames.Point3fArray,
+                 Vt.Vec3fArray.FromNumpy(np.ascontiguousarray(points[select], dtype=np.float32))),
+                ('protoIndices', Sdf.ValueTypeNames.IntArray,
+                 Vt.IntArray.FromNumpy(proto[select].astype(np.int32))),
+                ('extent', Sdf.ValueTypeNames.Float3Array,
+                 Vt.Vec3fArray.FromNumpy(np.stack([tile_coords.min(axis=0),
+                                                   tile_coords.max(axis=0) + 1]).astype(np.float32)))):
+            Sdf.AttributeSpec(prim_spec, name, type_name).default = value
+    layer.Save()
+
+    summary = {
+        "layer": out_path,
+        "chunks": len(chunks.get("chunks")),
+        "regions": len(tiles.get("key")),
+        "prototypes": len(targets),
+    }
+    return summary
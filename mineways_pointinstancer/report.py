@@ -0,0 +1,81 @@
+"""Import report timing every stage"""
+import cProfile
+import contextlib
+import json
+import os
+import sys
+import time
+
+def peak_rss():
+    """Peak resident memory of this process in MiB, None where unknown"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return peak / (1 << 20) if sys.platform == 'darwin' else peak / 1024
+
+def new_report(paths=None, profile_dir=None):
+    """Import report collecting the stages timed with report_stage"""
+    report = {
+        "file_path": paths.get("file_path") if paths else None,
+        "started": time.time(),
+        "profile_dir": profile_dir,
+        "stages": [],
+    }
+    return report
+
+def chunk_counters(chunks):
+    """Chunk and point counts of flat or compact read_chunk tables"""
+    return {"chunks": len(chunks["chunks"]), "points": int(chunks["offsets"][-1])}
+
+def mesh_counters(meshes):
+    """Mesh, material and texture counts of read_mesh tables"""
+    return {"meshes": len(meshes["mesh"]), "materials": len(meshes["material"]), "textures": len(meshes["texture"])}
+
+@contextlib.contextmanager
+def report_stage(report, name):
+    """Time a pipeline stage into the report, yields the counters dict of
+    the stage to fill in. Does nothing but yield when report is None.
+    A stage opened inside another one is recorded with its 'parent' and is
+    left out of the profile files, the outer stage profiles it already."""
+    counters = {}
+    if report is None:
+        yield counters
+        return
+    active = report.setdefault("active", [])
+    parent = active[-1] if active else None
+    profile_dir = report.get("profile_dir")
+    profile = cProfile.Profile() if profile_dir and parent is None else None
+    start = time.perf_counter()
+    active.append(name)
+    if profile:
+        profile.enable()
+    try:
+        yield counters
+    finally:
+        if profile:
+            profile.disable()
+            os.makedirs(profile_dir, exist_ok=True)
+            profile.dump_stats(os.path.join(profile_dir, name + '.prof'))
+        active.pop()
+        stage = {
+            "stage": name,
+            "seconds": time.perf_counter() - start,
+            "peak_rss_mb": peak_rss(),
+            "counters": counters,
+        }
+        if parent is not None:
+            stage["parent"] = parent
+        report["stages"].append(stage)
+
+def write_report(report, file_path):
+    """Write the report as JSON, numpy scalars included. The total only
+    adds up the outer stages, nested ones are part of their parent."""
+    report = dict(report)
+    report.pop("active", None)
+    report["seconds"] = sum(stage["seconds"] for stage in report["stages"] if "parent" not in stage)
+    with open(file_path, 'w') as f:
+        json.dump(report, f, indent=2, default=lambda v: v.item() if hasattr(v, 'item') else str(v))
+    return file_path
@@ -0,0 +1,182 @@
+"""Synthetic Mineways style exports written with pxr, for tests and benchmarks"""
+import argparse
+import math
+import os
+import struct
+import zlib
+import numpy as np
+from pxr import Usd, UsdGeom, UsdShade, Sdf, Vt
+
+CHUNK_SIZE = 16
+
+# Unit cube faces as (normal, corners) in the Mineways block space
+CUBE_FACES = {
+    "top": ((0, 1, 0), [(0, 1, 0), (0, 1, 1), (1, 1, 1), (1, 1, 0)]),
+    "bottom": ((0, -1, 0), [(0, 0, 0), (1, 0, 0), (1, 0, 1), (0, 0, 1)]),
+    "north": ((0, 0, -1), [(0, 0, 0), (0, 1, 0), (1, 1, 0), (1, 0, 0)]),
+    "south": ((0, 0, 1), [(0, 0, 1), (1, 0, 1), (1, 1, 1), (0, 1, 1)]),
+    "west": ((-1, 0, 0), [(0, 0, 0), (0, 0, 1), (0, 1, 1), (0, 1, 0)]),
+    "east": ((1, 0, 0), [(1, 0, 0), (1, 1, 0), (1, 1, 1), (1, 0, 1)]),
+}
+FACE_UV = [(0, 0), (0, 1), (1, 1), (1, 0)]
+
+def synth_paths(root, world_name="Synth World", file_name="synth"):
+    """File layout matching read_path, the BlockLibrary lives in
+    <world>/<file>/<file>_materials/"""
+    world_dir = os.path.join(root, world_name)
+    materials_dir = os.path.join(world_dir, file_name, file_name + '_materials')
+    return {
+        "file_path": os.path.join(world_dir, file_name + '.usda'),
+        "materials_dir": materials_dir,
+        "blocklib_filepath": os.path.join(materials_dir, 'BlockLibrary.usda'),
+        "world_name": world_name,
+        "file_name": file_name,
+    }
+
+def write_png(file_path, pixels):
+    """Write an (H,W,4) uint8 array as an RGBA png"""
+    height, width = pixels.shape[:2]
+    raw = b''.join(b'\x00' + pixels[y].tobytes() for y in range(height))
+
+    def chunk(tag, data):
+        body = tag + data
+        return struct.pack('>I', len(data)) + body + struct.pack('>I', zlib.crc32(body) & 0xffffffff)
+
+    with open(file_path, 'wb') as f:
+        f.write(b'\x89PNG\r\n\x1a\n')
+        f.write(chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 6, 0, 0, 0)))
+        f.write(chunk(b'IDAT', zlib.compress(raw)))
+        f.write(chunk(b'IEND', b''))
+
+def define_material(stage, path, texture):
+    """UsdPreviewSurface material with a diffuse_texture file shader"""
+    material = UsdShade.Material.Define(stage, path)
+    surface = UsdShade.Shader.Define(stage, path + '/PBRShader')
+    surface.CreateIdAttr('UsdPreviewSurface')
+    diffuse = UsdShade.Shader.Define(stage, path + '/diffuse_texture')
+    diffuse.CreateIdAttr('UsdUVTexture')
+    diffuse.CreateInput('file', Sdf.ValueTypeNames.Asset).Set(texture)
+    diffuse.CreateOutput('rgb', Sdf.ValueTypeNames.Float3)
+    surface.CreateInput('diffuseColor', Sdf.ValueTypeNames.Color3f).ConnectToSource(
+        diffuse.ConnectableAPI(), 'rgb')
+    material.CreateSurfaceOutput().ConnectToSource(surface.ConnectableAPI(), 'surface')
+    return material
+
+def define_faces(stage, path, faces, material):
+    """Mesh made of the named cube faces, bound to material"""
+    mesh = UsdGeom.Mesh.Define(stage, path)
+    points = []
+    uvs = []
+    for face in faces:
+        points.extend(CUBE_FACES[face][1])
+        uvs.extend(FACE_UV)
+    mesh.CreatePointsAttr(points)
+    mesh.CreateFaceVertexCountsAttr([4] * len(faces))
+    mesh.CreateFaceVertexIndicesAttr(list(range(len(points))))
+    mesh.CreateExtentAttr([(0, 0, 0), (1, 1, 1)])
+    st = UsdGeom.PrimvarsAPI(mesh).CreatePrimvar(
+        'st', Sdf.ValueTypeNames.TexCoord2fArray, UsdGeom.Tokens.faceVarying)
+    st.Set(uvs)
+    UsdShade.MaterialBindingAPI.Apply(mesh.GetPrim()).Bind(material)
+    return mesh
+
+def write_blocklibrary(paths, prototypes=32, merged_ratio=0.25, duplicate_ratio=0.0, seed=0):
+    """BlockLibrary.usda with single mesh full cubes and merged blocks made
+    of top, side and bottom meshes. Returns the prototype block names."""
+    rng = np.random.default_rng(seed)
+    os.makedirs(paths.get("materials_dir"), exist_ok=True)
+    stage = Usd.Stage.CreateNew(paths.get("blocklib_filepath"))
+    UsdGeom.SetStageUpAxis(stage, UsdGeom.Tokens.y)
+    root = UsdGeom.Xform.Define(stage, '/BlockLib')
+    stage.SetDefaultPrim(root.GetPrim())
+    UsdGeom.Scope.Define(stage, '/BlockLib/Blocks')
+    UsdGeom.Scope.Define(stage, '/BlockLib/Blocks/Looks')
+
+    textures = []
+    def texture(name):
+        # Some textures are byte identical copies of an earlier one
+        if textures and rng.random() < duplicate_ratio:
+            pixels = textures[rng.integers(len(textures))]
+        else:
+            pixels = rng.integers(0, 256, size=(16, 16, 4), dtype=np.uint8)
+            pixels[..., 3] = 255
+        textures.append(pixels)
+        write_png(os.path.join(paths.get("materials_dir"), name + '.png'), pixels)
+        return './' + name + '.png'
+
+    merged_count = int(round(prototypes * merged_ratio))
+    blocks = []
+    for ip in range(prototypes):
+        block_id = ip + 1
+        block_name = 'Block_%d_0' % block_id
+        block_path = '/BlockLib/Blocks/' + block_name
+        block = UsdGeom.Xform.Define(stage, block_path)
+        block.GetPrim().CreateAttribute('typeName', Sdf.ValueTypeNames.String).Set('block_%d' % block_id)
+        if ip < merged_count:
+            parts = {
+                "top": ["top"],
+                "side": ["north", "south", "west", "east"],
+                "bottom": ["bottom"],
+            }
+        else:
+            parts = {"cube": list(CUBE_FACES)}
+        for part, faces in parts.items():
+            name = 'block_%d_%s' % (block_id, part)
+            material = define_material(stage, '/BlockLib/Blocks/Looks/' + name, texture(name))
+            define_faces(stage, block_path + '/' + name, faces, material)
+        blocks.append(block_name)
+    stage.Save()
+    return blocks
+
+def write_world(root, chunks=16, points=4096, prototypes=32, merged_ratio=0.25,
+                palette=16, duplicate_ratio=0.0, world_name="Synth World", file_name="synth", seed=0):
+    """Write a Mineways shaped export: a root layer with one PointInstancer
+    per 16x16 chunk under /<world>/VoxelMap, filled bottom up with points
+    per chunk blocks, and a referenced BlockLibrary. Returns synth_paths."""
+    rng = np.random.default_rng(seed)
+    paths = synth_paths(root, world_name, file_name)
+    blocks = write_blocklibrary(paths, prototypes, merged_ratio, duplicate_ratio, seed)
+
+    stage = Usd.Stage.CreateNew(paths.get("file_path"))
+    UsdGeom.SetStageUpAxis(stage, UsdGeom.Tokens.y)
+    world_path = '/' + world_name.replace(' ', '_')
+    voxel_path = world_path + '/VoxelMap'
+    world = UsdGeom.Xform.Define(stage, world_path)
+    stage.SetDefaultPrim(world.GetPrim())
+    UsdGeom.Xform.Define(stage, voxel_path)
+    blocklib = stage.DefinePrim(voxel_path + '/BlockLib')
+    reference = os.path.relpath(paths.get("blocklib_filepath"), os.path.dirname(paths.get("file_path")))
+    blocklib.GetReferences().AddReference('./' + reference.replace(os.sep, '/'))
+
+    # Chunk columns filled layer by layer from the bottom
+    layers = max(1, math.ceil(points / (CHUNK_SIZE * CHUNK_SIZE)))
+    y, x, z = np.meshgrid(np.arange(layers), np.arange(CHUNK_SIZE), np.arange(CHUNK_SIZE), indexing='ij')
+    column = np.stack([x.ravel(), y.ravel(), z.ravel()], axis=1)[:points]
+    side = max(1, math.ceil(math.sqrt(chunks)))
+    palette = max(1, min(palette, prototypes))
+    for ic in range(chunks):
+        cx, cz = ic % side, ic // side
+        chunk = UsdGeom.PointInstancer.Define(stage, '%s/Chunk_%d_%d' % (voxel_path, cx, cz))
+        local = rng.choice(prototypes, size=palette, replace=False)
+        chunk.CreatePrototypesRel().SetTargets(
+            [Sdf.Path('%s/BlockLib/Blocks/%s' % (voxel_path, blocks[i])) for i in local])
+        pos = (column + (cx * CHUNK_SIZE, 0, cz * CHUNK_SIZE)).astype(np.float32)
+        chunk.CreatePositionsAttr(Vt.Vec3fArray.FromNumpy(pos))
+        chunk.CreateProtoIndicesAttr(Vt.IntArray.FromNumpy(
+            rng.integers(0, palette, size=len(pos)).astype(np.int32)))
+    stage.Save()
+    return paths
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write a synthetic Mineways style USD export")
+    parser.add_argument("root", help="output folder")
+    parser.add_argument("--chunks", type=int, default=16)
+    parser.add_argument("--points", type=int, default=4096, help="points per chunk")
+    parser.add_argument("--prototypes", type=int, default=32)
+    parser.add_argument("--merged-ratio", type=float, default=0.25)
+    parser.add_argument("--palette", type=int, default=16, help="prototypes per chunk")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    written = write_world(args.root, args.chunks, args.points, args.prototypes,
+                          args.merged_ratio, args.palette, seed=args.seed)
+    print(written.get("file_path"))
@@ -0,0 +1,141 @@
+"""Texture deduplication and atlas packing"""
+import os
+import numpy as np
+from pxr import Sdf, Vt
+from .cache import file_hash
+from .convert import new_layer
+
+def texture_files(meshes):
+    """Resolved file path of every texture of read_mesh, None when missing"""
+    files = []
+    for texture in meshes.get("texture"):
+        file_path = texture.resolvedPath or None
+        files.append(file_path if file_path and os.path.isfile(file_path) else None)
+    return files
+
+def dedupe_textures(meshes):
+    """Collapse byte identical textures
+    'file' : resolved file of every texture, None when missing
+    'hash' : content hash of every texture
+    'unique' : int32 index of the first texture with the same content
+    """
+    files = texture_files(meshes)
+    hashes = []
+    unique = np.arange(len(files), dtype=np.int32)
+    seen = {}
+    for it, file_path in enumerate(files):
+        digest = file_hash(file_path) if file_path else None
+        hashes.append(digest)
+        if digest is not None:
+            unique[it] = seen.setdefault(digest, it)
+    texture_dict = {
+        "file": files,
+        "hash": hashes,
+        "unique": unique,
+    }
+    return texture_dict
+
+def pack_atlas(files, out_path, pad=2):
+    """Pack images into one atlas with shelf packing, tallest first. Every
+    image is surrounded by pad copies of its edge pixels, so linear or
+    mipmapped sampling near a rect border does not bleed its neighbours.
+    Returns the atlas size and the (x, y, w, h) pixel rect of every file,
+    y counted from the top and without the padding. Needs Pillow."""
+    try:
+        from PIL import Image
+    except ImportError:
+        raise ImportError("Pillow is needed to pack a texture atlas")
+    images = [Image.open(f).convert('RGBA') for f in files]
+    images = [Image.fromarray(np.pad(np.asarray(im), ((pad, pad), (pad, pad), (0, 0)), mode='edge'))
+              for im in images]
+    area = sum(im.width * im.height for im in images)
+    width = max([im.width for im in images] + [1])
+    while width * width < area:
+        width *= 2
+    rects = [None] * len(images)
+    x = y = shelf = 0
+    for i in sorted(range(len(images)), key=lambda i: -images[i].height):
+        im = images[i]
+        if x + im.width > width:
+            x, y, shelf = 0, y + shelf, 0
+        rects[i] = (x, y, im.width, im.height)
+        x += im.width
+        shelf = max(shelf, im.height)
+    height = max([r[1] + r[3] for r in rects] + [1])
+    atlas = Image.new('RGBA', (width, height))
+    for im, rect in zip(images, rects):
+        atlas.paste(im, rect[:2])
+    atlas.save(out_path)
+    return (width, height), [(x + pad, y + pad, w - 2 * pad, h - 2 * pad) for x, y, w, h in rects]
+
+def write_texture_layer(paths, usd_paths, meshes, atlas=False, out_path=None):
+    """Write a layer over the export pointing every diffuse_texture at one
+    copy of each distinct image. With atlas the images are packed into a
+    single edge padded atlas, sampled with clamp wrapping, and the mesh st
+    primvars are remapped into their rect, which only suits st within 0 to 1.
+    UsdUVTexture has no filtering input, nearest filtering is left to the
+    renderer's texture settings. Returns a summary of the texture counts."""
+    stage = usd_paths.get("stage")
+    directory = os.path.dirname(paths.get("file_path"))
+    if out_path is None:
+        out_path = os.path.join(directory, paths.get("file_name") + '_textures.usda')
+    out_dir = os.path.dirname(os.path.abspath(out_path))
+    textures = dedupe_textures(meshes)
+    files = textures.get("file")
+    unique = textures.get("unique")
+    used = sorted(set(int(unique[i]) for i in range(len(files)) if files[i]))
+
+    def relative(file_path):
+        return './' + os.path.relpath(file_path, out_dir).replace(os.sep, '/')
+
+    layer = new_layer(out_path)
+    layer.subLayerPaths.append(relative(paths.get("file_path")))
+    rects = {}
+    size = None
+    if atlas and used:
+        atlas_path = os.path.join(out_dir, paths.get("file_name") + '_atlas.png')
+        size, packed = pack_atlas([files[i] for i in used], atlas_path)
+        rects = dict(zip(used, packed))
+
+    material_texture = meshes.get("material_texture")
+    for im, material in enumerate(meshes.get("material")):
+        texture = material_texture[im]
+        if texture < 0 or not files[texture]:
+            continue
+        canonical = int(unique[texture])
+        target = atlas_path if rects else files[canonical]
+        shader = Sdf.CreatePrimInLayer(layer, material.AppendChild('diffuse_texture'))
+        Sdf.AttributeSpec(shader, 'inputs:file', Sdf.ValueTypeNames.Asset).default = Sdf.AssetPath(relative(target))
+        if rects:
+            for name in ('inputs:wrapS', 'inputs:wrapT'):
+                Sdf.AttributeSpec(shader, name, Sdf.ValueTypeNames.Token).default = 'clamp'
+
+    if rects:
+        mesh_material = meshes.get("mesh_material")
+        for imesh, mesh in enumerate(meshes.get("mesh")):
+            material = mesh_material[imesh]
+            texture = material_texture[material] if material >= 0 else -1
+            if texture < 0 or not files[texture]:
+                continue
+            mesh_path = mesh if isinstance(mesh, Sdf.Path) else mesh.GetPath()
+            st = stage.GetPrimAtPath(mesh_path).GetAttribute('primvars:st')
+            value = st.Get() if st else None
+            if value is None:
+                continue
+            x, y, w, h = rects[int(unique[texture])]
+            scale = np.array([w / size[0], h / size[1]])
+            offset = np.array([x / size[0], 1 - (y + h) / size[1]])
+            remapped = np.asarray(value, dtype=np.float64).reshape(-1, 2) * scale + offset
+            prim_spec = Sdf.CreatePrimInLayer(layer, mesh_path)
+            Sdf.AttributeSpec(prim_spec, 'primvars:st', Sdf.ValueTypeNames.TexCoord2fArray).default = \
+                Vt.Vec2fArray.FromNumpy(remapped.astype(np.float32))
+    layer.Save()
+
+    summary = {
+        "layer": out_path,
+        "textures": len(files),
+        "missing": sum(1 for f in files if not f),
+        "unique": len(used),
+        "atlas": list(size) if size else None,
+    }
+    return summary
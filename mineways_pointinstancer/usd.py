@@ -0,0 +1,552 @@
+"""Readers of the Mineways export through pxr"""
+import os
+import queue
+import threading
+import weakref
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from pxr import Usd, Sdf
+from .chunks import encode_chunk, filter_blocks, filter_points, finish_blocks, new_blocks, pack_chunks, voxel_coords
+
+def read_path(file_path):
+    """Create needed paths for the USD to get
+    """
+    
+    path = os.path.splitext(file_path)
+    base = os.path.basename(file_path)
+    file_name = os.path.splitext(base)[0]
+
+    blocklib_path = os.path.join(path[0], file_name + '_materials', 'BlockLibrary.usda')
+    world_name = os.path.basename(os.path.dirname(os.path.abspath(file_path)))
+
+    paths = {
+        "file_path": file_path,
+        "directory_filepath": path[0],
+        "blocklib_filepath": blocklib_path,
+        "file_name": file_name,
+        "world_name": world_name,
+    }
+
+    return paths
+
+def voxelmap_path(paths):
+    """USD path of the VoxelMap holding the chunks"""
+    world_name = paths.get("world_name")
+    world_str = str(world_name).replace(' ','_')
+    return '/'+world_str+'/VoxelMap'
+
+def read_usd(paths, region=None, chunks=True):
+    """Read the stage creation
+    region : only compose the chunks intersecting a box or sphere,
+    {"box": (min, max)} or {"center": (x,y,z), "radius": r}
+    chunks : False to only compose the BlockLib, when the chunks are
+    decoded somewhere else
+    """
+
+    usd_worldpath = voxelmap_path(paths)
+    usd_blockpath = usd_worldpath+'/BlockLib'
+
+    selected = None
+    if not chunks:
+        selected = []
+    elif region:
+        selected = select_chunks(index_chunks(paths), **region)
+    if selected is None:
+        stage_ref = Usd.Stage.Open(paths.get("file_path"))
+    else:
+        mask = Usd.StagePopulationMask()
+        mask.Add(Sdf.Path(usd_blockpath))
+        for chunk_name in selected:
+            mask.Add(Sdf.Path(usd_worldpath + chunk_name))
+        stage_ref = Usd.Stage.OpenMasked(paths.get("file_path"), mask)
+    block_ref = stage_ref.GetPrimAtPath(usd_blockpath+'/Blocks')
+    voxel_ref = stage_ref.GetPrimAtPath(usd_worldpath)
+    chunk_ref = voxel_ref.GetChildren()
+
+    stage_dict = {
+        "stage": stage_ref,
+        "blocklib" :  block_ref,
+        "chunk": chunk_ref,
+        "voxelmap": voxel_ref,
+        "world_path": usd_worldpath,
+        "block_path": usd_blockpath,
+        "region": selected,
+    }
+    return stage_dict
+
+def index_chunks(paths, counts=False, prototypes=False):
+    """Spatial index of the chunks read from the root layer specs,
+    without composing the stage. Bounds come from the authored extent,
+    or from the positions when there is none.
+    'chunks' : chunk names
+    'min', 'max' : (C,3) float64 bounds of each chunk
+    'count' : point count of each chunk, -1 when it was not read
+    with prototypes=True also
+    'path' : prototype targets of each chunk
+    'usage' : int64 array per chunk, points per local prototype index
+    """
+    layer = Sdf.Layer.FindOrOpen(paths.get("file_path"))
+    voxel_spec = layer.GetPrimAtPath(voxelmap_path(paths)) if layer else None
+    if not voxel_spec:
+        return None
+
+    _chunks = []
+    _min = []
+    _max = []
+    _count = []
+    _path = []
+    _usage = []
+    for chunk_spec in voxel_spec.nameChildren:
+        if not 'Chunk' in chunk_spec.name:
+            continue
+        if prototypes:
+            rel_spec = chunk_spec.relationships.get('prototypes')
+            targets = list(rel_spec.targetPathList.GetAddedOrExplicitItems()) if rel_spec else []
+            id_spec = chunk_spec.attributes.get('protoIndices')
+            id = id_spec.default if id_spec else None
+            id = np.asarray(id if id is not None else [], dtype=np.int64)
+            _path.append(targets)
+            _usage.append(np.bincount(id, minlength=len(targets)))
+        extent_spec = chunk_spec.attributes.get('extent')
+        extent = extent_spec.default if extent_spec else None
+        pos = None
+        if counts or not extent:
+            pos_spec = chunk_spec.attributes.get('positions')
+            pos = pos_spec.default if pos_spec else None
+        if extent:
+            lo, hi = np.asarray(extent, dtype=np.float64).reshape(2, 3)
+        elif pos:
+            coords = voxel_coords(np.asarray(pos, dtype=np.float32).reshape(-1, 3))
+            lo, hi = coords.min(axis=0), coords.max(axis=0) + 1
+        else:
+            lo = hi = np.zeros(3)
+        _chunks.append('/' + chunk_spec.name)
+        _min.append(lo)
+        _max.append(hi)
+        _count.append(len(pos) if pos is not None else -1)
+
+    index_dict = {
+        "chunks": _chunks,
+        "min": np.array(_min, dtype=np.float64).reshape(-1, 3),
+        "max": np.array(_max, dtype=np.float64).reshape(-1, 3),
+        "count": np.array(_count, dtype=np.int64),
+    }
+    if prototypes:
+        index_dict["path"] = _path
+        index_dict["usage"] = _usage
+    return index_dict
+
+def select_chunks(index, box=None, center=None, radius=None):
+    """Names of the indexed chunks intersecting an axis aligned box
+    (min, max) or a sphere (center, radius), None without an index"""
+    if index is None:
+        return None
+    lo = index.get("min")
+    hi = index.get("max")
+    hit = np.ones(len(lo), dtype=bool)
+    if box is not None:
+        box_min, box_max = np.asarray(box, dtype=np.float64).reshape(2, 3)
+        hit &= np.all((lo <= box_max) & (hi >= box_min), axis=1)
+    if center is not None:
+        center = np.asarray(center, dtype=np.float64)
+        nearest = np.clip(center, lo, hi)
+        hit &= ((nearest - center) ** 2).sum(axis=1) <= float(radius) ** 2
+    return [name for name, h in zip(index.get("chunks"), hit) if h]
+
+def read_chunk(usd_paths, flat=False, compact=False, rle=False, filters=None):
+    """Reading though the chunks of the usd file
+    'path' : reference path of blocks in the chunks
+    'chunks' : chunks
+    'points' : point postions 
+    'indicies': block indicies to use for instancing
+
+    With flat=True the world arrays are sized from the protoIndices lengths
+    first, then every chunk is written into them as it is read:
+    'points' : (N,3) float32 positions of every chunk
+    'indices' : (N,) int32 protoIndices of every chunk
+    'offsets' : (C+1,) int64 start of each chunk in the world arrays,
+    chunk ic is points[offsets[ic]:offsets[ic+1]]
+
+    With compact=True every chunk is encoded as it is read and its float
+    positions dropped, see compact_chunks.
+    filters : block include and exclude filters, see filter_blocks, the
+    filtered instances are dropped as each chunk is decoded
+    """
+    chunk_refs = [c for c in usd_paths.get("chunk") if 'Chunk' in c.GetName()]
+    
+    chunk_dict = {
+        "chunks": [],
+        "path" : [],
+        "points" : [],
+        "indices": []
+    }
+
+    # First walk: prototype targets, filter masks and the kept point count
+    # of every chunk, so the world arrays are allocated once
+    masks = []
+    counts = []
+    names = {}
+    for chunk_ref in chunk_refs:
+        rel = chunk_ref.GetRelationship('prototypes')
+        blocks_path = rel.GetTargets()
+        keep = None
+        if filters:
+            keep = filter_blocks(filters, blocks_path, type_names(chunk_ref.GetStage(), blocks_path, names))
+        if flat and not compact:
+            id = chunk_ref.GetAttribute('protoIndices').Get()
+            id = np.asarray(id if id is not None else [], dtype=np.int32)
+            counts.append(len(id) if keep is None else int(keep[id].sum()))
+        chunk_dict['path'].append(blocks_path)
+        chunk_dict['chunks'].append('/' + chunk_ref.GetName())
+        masks.append(keep)
+
+    if flat and not compact:
+        offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+        chunk_dict["points"] = np.empty((offsets[-1], 3), dtype=np.float32)
+        chunk_dict["indices"] = np.empty(offsets[-1], dtype=np.int32)
+        chunk_dict["offsets"] = offsets
+
+    encoded = []
+    for ic, chunk_ref in enumerate(chunk_refs):
+        pos = chunk_ref.GetAttribute('positions').Get()
+        id = chunk_ref.GetAttribute('protoIndices').Get()
+        if masks[ic] is not None:
+            pos, id = filter_points(pos, id, masks[ic])
+        if compact:
+            encoded.append(encode_chunk(pos, id, rle))
+        elif flat:
+            start, end = offsets[ic], offsets[ic + 1]
+            if start == end:
+                continue
+            # Vt arrays expose the buffer protocol, this is a single memcpy
+            chunk_dict["points"][start:end] = np.asarray(pos, dtype=np.float32).reshape(-1, 3)
+            chunk_dict["indices"][start:end] = np.asarray(id, dtype=np.int32)
+        else:
+            chunk_dict['points'].append(pos)
+            chunk_dict['indices'].append(id)
+
+    if compact:
+        chunk_dict = pack_chunks(chunk_dict, encoded, rle)
+    return chunk_dict
+
+def type_names(stage, targets, names):
+    """Fill names with the typeName of the prototype targets not in it yet"""
+    for target in targets:
+        if target.name not in names:
+            block_ref = stage.GetPrimAtPath(target)
+            attr = block_ref.GetAttribute('typeName') if block_ref else None
+            names[target.name] = attr.Get() if attr else None
+    return names
+
+def read_chunk_parallel(paths, workers=None, region=None, filters=None):
+    """Decode the chunks on a process pool, every worker opens the stage
+    masked to its own chunks and writes positions and protoIndices straight
+    into shared memory. Returns the same flat dict as read_chunk(flat=True),
+    its points and indices are the shared memory itself, released once the
+    arrays and their views are dropped.
+    The module has to be importable by the workers, so this is meant for
+    plain Python runs rather than the Blender text editor.
+    filters are resolved here against the root layer prototype targets,
+    so the shared buffers only hold the kept instances
+    """
+    index = index_chunks(paths, counts=True, prototypes=bool(filters))
+    if index is None:
+        raise ValueError("No VoxelMap in the root layer of " + paths.get("file_path"))
+    names = index.get("chunks")
+    counts = index.get("count")
+    masks = [None] * len(names)
+    if filters:
+        type_names = block_names(paths)
+        masks = [filter_blocks(filters, targets, type_names) for targets in index["path"]]
+        counts = np.array([usage[:len(keep)][keep].sum() for usage, keep in zip(index["usage"], masks)], dtype=np.int64)
+    if region:
+        selected = set(select_chunks(index, **region))
+        keep = np.array([name in selected for name in names], dtype=bool)
+        names = [name for name, k in zip(names, keep) if k]
+        counts = counts[keep]
+        masks = [m for m, k in zip(masks, keep) if k]
+
+    offsets = np.zeros(len(names) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    total = int(offsets[-1])
+    workers = max(1, min(workers or os.cpu_count() or 1, len(names) or 1))
+
+    # Contiguous runs of chunks with about the same number of points each
+    bounds = np.searchsorted(offsets, np.linspace(0, total, workers + 1), side='left')
+    bounds[0], bounds[-1] = 0, len(names)
+
+    shm_points = shared_memory.SharedMemory(create=True, size=max(total * 12, 1))
+    shm_indices = shared_memory.SharedMemory(create=True, size=max(total * 4, 1))
+    try:
+        jobs = []
+        for w in range(workers):
+            start, end = bounds[w], bounds[w + 1]
+            if start >= end:
+                continue
+            jobs.append({
+                "file_path": paths.get("file_path"),
+                "world_path": voxelmap_path(paths),
+                "chunks": names[start:end],
+                "masks": [m.tolist() if m is not None else None for m in masks[start:end]],
+                "offsets": offsets[start:end + 1].tolist(),
+                "total": total,
+                "points": shm_points.name,
+                "indices": shm_indices.name,
+            })
+        with ProcessPoolExecutor(max_workers=len(jobs) or 1) as pool:
+            results = list(pool.map(decode_chunks, jobs))
+    except BaseException:
+        for shm in (shm_points, shm_indices):
+            shm.close()
+            shm.unlink()
+        raise
+
+    chunk_path = []
+    for result in results:
+        chunk_path.extend([[Sdf.Path(t) for t in targets] for targets in result])
+
+    points = np.ndarray((total, 3), dtype=np.float32, buffer=shm_points.buf)
+    indices = np.ndarray(total, dtype=np.int32, buffer=shm_indices.buf)
+    for array, shm in ((points, shm_points), (indices, shm_indices)):
+        # The name goes now, the mapping stays until the array and every
+        # view of it are gone, views keep the array itself as their base
+        shm.unlink()
+        weakref.finalize(array, shm.close)
+    chunk_dict = {
+        "chunks": list(names),
+        "path": chunk_path,
+        "points": points,
+        "indices": indices,
+        "offsets": offsets,
+    }
+    return chunk_dict
+
+def decode_chunks(job):
+    """Process pool worker of read_chunk_parallel, returns the prototype
+    targets of its chunks"""
+    world_path = job.get("world_path")
+    offsets = job.get("offsets")
+    total = job.get("total")
+    mask = Usd.StagePopulationMask()
+    for chunk_name in job.get("chunks"):
+        mask.Add(Sdf.Path(world_path + chunk_name))
+    stage = Usd.Stage.OpenMasked(job.get("file_path"), mask)
+
+    shm_points = shared_memory.SharedMemory(name=job.get("points"))
+    shm_indices = shared_memory.SharedMemory(name=job.get("indices"))
+    points = np.ndarray((total, 3), dtype=np.float32, buffer=shm_points.buf)
+    indices = np.ndarray(total, dtype=np.int32, buffer=shm_indices.buf)
+    targets = []
+    try:
+        for ic, chunk_name in enumerate(job.get("chunks")):
+            chunk_ref = stage.GetPrimAtPath(world_path + chunk_name)
+            pos = chunk_ref.GetAttribute('positions').Get()
+            id = chunk_ref.GetAttribute('protoIndices').Get()
+            keep = job.get("masks")[ic]
+            if keep is not None:
+                pos, id = filter_points(pos, id, np.array(keep, dtype=bool))
+            start, end = offsets[ic], offsets[ic + 1]
+            if len(pos if pos is not None else []) != end - start or len(id if id is not None else []) != end - start:
+                raise ValueError(chunk_name + " does not match the point count of the root layer")
+            if end > start:
+                points[start:end] = np.asarray(pos, dtype=np.float32).reshape(-1, 3)
+                indices[start:end] = np.asarray(id, dtype=np.int32)
+            targets.append([str(t) for t in chunk_ref.GetRelationship('prototypes').GetTargets()])
+    finally:
+        del points, indices
+        shm_points.close()
+        shm_indices.close()
+    return targets
+
+def iter_chunks(usd_paths, lookahead=4, blocks=None, filters=None):
+    """Yield the chunks one at a time as a background thread decodes them,
+    at most lookahead chunks ahead of the consumer. Closing the generator
+    stops the reader, so a host can cancel an import part way.
+    blocks : prototype table from new_blocks to extend, every yielded
+    chunk has its prototypes registered in it before it is yielded
+    filters : block filters applied by the reader, see filter_blocks
+    Every chunk is a dict
+    'index' : position of the chunk in the VoxelMap
+    'chunk' : chunk name
+    'path' : prototype targets of the chunk
+    'points' : (n,3) float32 positions
+    'indices' : (n,) int32 protoIndices
+    'remap' : int32 local prototype index to the index in blocks
+    'blocks' : the prototype table, its columns are lists, see finish_blocks
+    """
+    stage = usd_paths.get("stage")
+    if blocks is None:
+        blocks = new_blocks()
+    chunk_refs = [c for c in usd_paths.get("chunk") if 'Chunk' in c.GetName()]
+    pending = queue.Queue(maxsize=max(1, lookahead))
+    stop = threading.Event()
+    done = object()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                pending.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def reader():
+        names = {}
+        try:
+            for ic, chunk_ref in enumerate(chunk_refs):
+                pos = chunk_ref.GetAttribute('positions').Get()
+                id = chunk_ref.GetAttribute('protoIndices').Get()
+                targets = chunk_ref.GetRelationship('prototypes').GetTargets()
+                if filters:
+                    keep = filter_blocks(filters, targets, type_names(stage, targets, names))
+                    pos, id = filter_points(pos, id, keep)
+                item = {
+                    "index": ic,
+                    "chunk": '/' + chunk_ref.GetName(),
+                    "path": targets,
+                    "points": np.array(pos if pos is not None else [], dtype=np.float32).reshape(-1, 3),
+                    "indices": np.array(id if id is not None else [], dtype=np.int32),
+                }
+                if not put(item):
+                    return
+            put(done)
+        except BaseException as error:
+            put(error)
+
+    thread = threading.Thread(target=reader, name="iter_chunks", daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = pending.get()
+            if item is done:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            item["remap"] = register_blocks(blocks, stage, item["path"])
+            item["blocks"] = blocks
+            yield item
+    finally:
+        stop.set()
+        thread.join()
+
+def read_block(usd_paths,chunks):
+    """Read through the blocks of the chunks into a global prototype table,
+    each prototype path is resolved once no matter how many chunks use it.
+    'path' : prototype Sdf.Path, the key of the table
+    'block' : block name in number form
+    'name': block real name
+    'id' : int32 array of the Minecraft block id
+    'sub_id': int32 array of the sub nbt id of that block 
+    'merged' : bool array, True when the block has several meshes to merge
+    'remap' : int32 array per chunk, local prototype index to global index
+    'lookup' : dict of Sdf.Path to global index
+    """
+    stage = usd_paths.get("stage")
+    block_path = chunks.get("path")
+
+    block_dict = new_blocks()
+    for blocks in block_path:
+        block_dict["remap"].append(register_blocks(block_dict, stage, blocks))
+    return finish_blocks(block_dict)
+
+def register_blocks(block_dict, stage, blocks):
+    """Add the prototypes of one chunk to a growing prototype table,
+    returns the chunk's int32 local to global remap"""
+    lookup = block_dict["lookup"]
+    _remap = np.empty(len(blocks), dtype=np.int32)
+    for ib, block in enumerate(blocks):
+        index = lookup.get(block)
+        if index is None:
+            index = len(block_dict["path"])
+            lookup[block] = index
+            block_name = block.name
+            block_ref = stage.GetPrimAtPath(block)
+            id = block_name.split("Block_")[1].split('_')
+            block_dict["path"].append(block)
+            block_dict["block"].append('/' + block_name)
+            block_dict["name"].append(block_ref.GetAttribute('typeName').Get())
+            block_dict["id"].append(int(id[0]))
+            block_dict["sub_id"].append(int(id[1]))
+            block_dict["merged"].append(len(block_ref.GetChildren()) >= 2) # instance pick
+        _remap[ib] = index
+    return _remap
+
+def read_mesh(usd_paths,blocks):
+    """ Read the block mesh
+    'block' : a list meshes of blocks, some blocks can have multiple meshes
+    'mesh' : a list of meshes used
+    'material': a list of materials used, the binding target paths
+    'texture': a list of unique textures used and its path
+    'mesh_material' : int32 array, material index of each mesh, -1 if unbound
+    'material_texture' : int32 array, texture index of each material, -1 if none
+    'lookup' : dict of material Sdf.Path to material index
+    'instance': a list of name for referencing instance
+    """
+    usd_blocklib_path = usd_paths.get("blocklib")
+
+    _material = []
+    _block = []
+    _texture = []
+    _mesh = []
+    _mesh_material = []
+    _material_texture = []
+    _instance = {}
+    lookup = {}
+    texture_lookup = {}
+    for blocks in usd_blocklib_path.GetChildren():
+        if blocks.GetName() == 'Looks':
+            continue
+        meshes = blocks.GetChildren()
+        for mesh in meshes:
+            mat_rel = mesh.GetRelationship('material:binding')
+            mat = mat_rel.GetTargets() if mat_rel else []
+            index = -1
+            if mat:
+                index = lookup.get(mat[0])
+                if index is None:
+                    index = len(_material)
+                    lookup[mat[0]] = index
+                    material_ref = mesh.GetStage().GetPrimAtPath(mat[0].AppendChild('diffuse_texture'))
+                    diffuse = material_ref.GetAttribute('inputs:file').Get() if material_ref else None
+                    texture = -1
+                    if diffuse is not None:
+                        texture = texture_lookup.setdefault(diffuse.path, len(_texture))
+                        if texture == len(_texture):
+                            _texture.append(diffuse)
+                    _material.append(mat[0])
+                    _material_texture.append(texture)
+            _mesh.append(mesh)
+            _mesh_material.append(index)
+            _instance[blocks.GetName()] = mesh.GetName()
+        _block.append(meshes)
+        
+    mesh_dict = {
+        "block": _block,
+        "mesh": _mesh,
+        "material": _material,
+        "texture": _texture,
+        "mesh_material": np.array(_mesh_material, dtype=np.int32),
+        "material_texture": np.array(_material_texture, dtype=np.int32),
+        "lookup": lookup,
+        "instance": _instance,
+    }
+    return mesh_dict
+
+def block_names(paths):
+    """typeName of every block of the BlockLibrary by block name, read from
+    the layer specs without composing it. Opening the layer still parses
+    its meshes."""
+    layer = Sdf.Layer.FindOrOpen(paths.get("blocklib_filepath"))
+    names = {}
+    if not layer:
+        return names
+    for root_spec in layer.rootPrims:
+        blocks_spec = root_spec.nameChildren.get('Blocks')
+        for block_spec in (blocks_spec.nameChildren if blocks_spec else []):
+            attr = block_spec.attributes.get('typeName')
+            if attr:
+                names[block_spec.name] = attr.default
+    return names
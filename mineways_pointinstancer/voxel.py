@@ -0,0 +1,181 @@
+"""Voxel grid, neighbour lookup and occlusion culling"""
+import numpy as np
+from .chunks import flatten_chunks, global_indices, voxel_coords
+
+# Face neighbour offsets, bit d of a neighbour mask is NEIGHBOURS[d]
+NEIGHBOURS = np.array([
+    (1, 0, 0), (-1, 0, 0),
+    (0, 1, 0), (0, -1, 0),
+    (0, 0, 1), (0, 0, -1),
+], dtype=np.int64)
+
+def voxel_grid(chunks):
+    """Build a sparse occupancy grid for the whole world,
+    cells are hashed into int64 keys and looked up with a binary search.
+    'coords' : (N,3) int64 voxel coordinate of every point
+    'origin' : minimum corner of the grid, one cell of padding included
+    'shape' : cell count of each axis
+    'keys' : sorted cell keys
+    'order' : point index of each sorted key
+    """
+    chunks = flatten_chunks(chunks)
+    coords = voxel_coords(chunks.get("points"))
+    if len(coords):
+        origin = coords.min(axis=0) - 1
+        shape = coords.max(axis=0) - origin + 2
+    else:
+        origin = np.zeros(3, dtype=np.int64)
+        shape = np.ones(3, dtype=np.int64)
+    keys = voxel_keys(coords, origin, shape)
+    order = np.argsort(keys, kind='stable')
+    grid = {
+        "coords": coords,
+        "origin": origin,
+        "shape": shape,
+        "keys": keys[order],
+        "order": order,
+    }
+    return grid
+
+def voxel_keys(coords, origin, shape):
+    """Linear cell key of voxel coordinates"""
+    local = coords - origin
+    return (local[:, 0] * shape[1] + local[:, 1]) * shape[2] + local[:, 2]
+
+def voxel_lookup(grid, coords):
+    """Point index occupying each voxel coordinate, -1 where empty"""
+    origin = grid.get("origin")
+    shape = grid.get("shape")
+    keys = grid.get("keys")
+    found = np.full(len(coords), -1, dtype=np.int64)
+    inside = np.all((coords >= origin) & (coords < origin + shape), axis=1)
+    query = voxel_keys(coords[inside], origin, shape)
+    pos = np.searchsorted(keys, query)
+    pos[pos == len(keys)] = 0
+    hit = keys[pos] == query if len(keys) else np.zeros(len(query), dtype=bool)
+    result = np.full(len(query), -1, dtype=np.int64)
+    result[hit] = grid["order"][pos[hit]]
+    found[inside] = result
+    return found
+
+def voxel_neighbours(grid, proto=None):
+    """Which of the 6 face neighbours of every point are occupied
+    'mask' : uint8 per point, bit d set when NEIGHBOURS[d] is occupied
+    'index' : (N,6) int64 point index of each neighbour, -1 if empty
+    'block' : (N,6) int32 prototype of each neighbour, -1 if empty,
+    only when proto (the prototype of every point) is given
+    """
+    shape = grid.get("shape")
+    keys = grid.get("keys")
+    order = grid.get("order")
+    index = np.full((len(keys), len(NEIGHBOURS)), -1, dtype=np.int64)
+    mask = np.zeros(len(keys), dtype=np.uint8)
+    for d, offset in enumerate(NEIGHBOURS):
+        # The grid is padded by a cell, so a neighbour key is a constant shift
+        # of the point key and the shifted keys are still sorted
+        shift = (offset[0] * shape[1] + offset[1]) * shape[2] + offset[2]
+        query = keys + shift
+        pos = np.searchsorted(keys, query)
+        pos[pos == len(keys)] = 0
+        hit = keys[pos] == query
+        index[order[hit], d] = order[pos[hit]]
+        mask[order[hit]] |= np.uint8(1 << d)
+    neighbour_dict = {
+        "mask": mask,
+        "index": index,
+    }
+    if proto is not None:
+        block = np.full(index.shape, -1, dtype=np.int32)
+        found = index >= 0
+        block[found] = np.asarray(proto)[index[found]]
+        neighbour_dict["block"] = block
+    return neighbour_dict
+
+def adjacent_point(chunks, grid=None, neighbours=None):
+    """Pairs of point indices whose positions differ by 1 on a single axis,
+    each pair is listed once as an (E,2) array"""
+    if grid is None:
+        grid = voxel_grid(chunks)
+    if neighbours is None:
+        neighbours = voxel_neighbours(grid)
+    index = neighbours.get("index")
+    edges = []
+    # Positive directions only, the negative ones are the same pairs reversed
+    for d in range(0, len(NEIGHBOURS), 2):
+        other = index[:, d]
+        found = np.nonzero(other >= 0)[0]
+        edges.append(np.stack([found, other[found]], axis=1))
+    return np.concatenate(edges)
+
+# Full cube blocks you can see through, matched against the block name
+TRANSPARENT_BLOCKS = ('glass', 'leaves', 'ice', 'water', 'lava', 'slime', 'honey', 'barrier', 'spawner')
+
+def block_opacity(usd_paths, blocks, transparent=TRANSPARENT_BLOCKS):
+    """Opacity table of the global prototypes, a block is opaque when it is
+    a single mesh filling the whole unit cube and is not see through"""
+    stage = usd_paths.get("stage")
+    names = blocks.get("name")
+    merged = blocks.get("merged")
+    opaque = np.zeros(len(blocks.get("path")), dtype=bool)
+    for ib, block in enumerate(blocks.get("path")):
+        if merged[ib]:
+            continue
+        name = str(names[ib] or '').lower()
+        if any(t in name for t in transparent):
+            continue
+        meshes = stage.GetPrimAtPath(block).GetChildren()
+        if len(meshes) != 1:
+            continue
+        verts = meshes[0].GetAttribute('points').Get()
+        if not verts:
+            continue
+        verts = np.asarray(verts, dtype=np.float32).reshape(-1, 3)
+        size = verts.max(axis=0) - verts.min(axis=0)
+        opaque[ib] = bool(np.all(size > 0.999))
+    return opaque
+
+def mask_chunks(chunks, keep):
+    """Keep only the masked points of the world arrays, the offset table
+    is rebuilt and 'removed' holds the dropped point count of every chunk"""
+    chunks = flatten_chunks(chunks)
+    offsets = chunks.get("offsets")
+    chunk_id = np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+    kept = np.bincount(chunk_id[keep], minlength=len(offsets) - 1)
+    new_offsets = np.zeros_like(offsets)
+    np.cumsum(kept, out=new_offsets[1:])
+
+    chunk_dict = dict(chunks)
+    chunk_dict["points"] = chunks["points"][keep]
+    chunk_dict["indices"] = chunks["indices"][keep]
+    chunk_dict["offsets"] = new_offsets
+    chunk_dict["removed"] = np.diff(offsets) - kept
+    return chunk_dict
+
+def cull_occluded(chunks, blocks, opaque, grid=None):
+    """Drop every point whose 6 face neighbours are all opaque blocks,
+    'culled' holds the removed point count of every chunk.
+    One direction is looked up at a time and folded into a single bool per
+    point, no neighbour table is kept."""
+    chunks = flatten_chunks(chunks)
+    if grid is None:
+        grid = voxel_grid(chunks)
+    shape = grid.get("shape")
+    keys = grid.get("keys")
+    order = grid.get("order")
+    # Opacity of every point in sorted key order
+    opaque_sorted = opaque[global_indices(chunks, blocks)[order]]
+    solid_sorted = np.ones(len(keys), dtype=bool)
+    for offset in NEIGHBOURS:
+        if not len(keys):
+            break
+        shift = (offset[0] * shape[1] + offset[1]) * shape[2] + offset[2]
+        query = keys + shift
+        pos = np.searchsorted(keys, query)
+        pos[pos == len(keys)] = 0
+        solid_sorted &= (keys[pos] == query) & opaque_sorted[pos]
+        del query, pos
+    solid = np.empty(len(keys), dtype=bool)
+    solid[order] = solid_sorted
+    chunk_dict = mask_chunks(chunks, ~solid)
+    chunk_dict["culled"] = chunk_dict.pop("removed")
+    return chunk_dict
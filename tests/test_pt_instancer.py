@@ -0,0 +1,564 @@
+import json
+import pstats
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+import pytest
+from pxr import Usd, UsdGeom, UsdShade
+
+import mineways_pointinstancer as pt
+from mineways_pointinstancer import batch, benchmark, synth_stage
+
+@pytest.fixture(scope="module")
+def world(tmp_path_factory) -> dict:
+  root = tmp_path_factory.mktemp("synth")
+  synth = synth_stage.write_world(str(root), chunks=6, points=600, prototypes=12, palette=5)
+  paths = pt.read_path(synth["file_path"])
+  assert paths["blocklib_filepath"] == synth["blocklib_filepath"]
+  return paths
+
+@pytest.fixture(scope="module")
+def usd_paths(world: dict) -> dict:
+  return pt.read_usd(world)
+
+@pytest.fixture(scope="module")
+def flat(usd_paths: dict) -> dict:
+  return pt.read_chunk(usd_paths, flat=True)
+
+@pytest.fixture(scope="module")
+def blocks(usd_paths: dict, flat: dict) -> dict:
+  return pt.read_block(usd_paths, flat)
+
+def test_flat_chunks(usd_paths: dict, flat: dict):
+  chunks = pt.read_chunk(usd_paths)
+  assert flat["chunks"] == chunks["chunks"]
+  assert flat["offsets"][-1] == len(flat["points"]) == 6 * 600
+  for ic in range(len(chunks["chunks"])):
+    points, indices = pt.chunk_slice(flat, ic)
+    assert np.array_equal(points, np.array(chunks["points"][ic]))
+    assert np.array_equal(indices, np.array(chunks["indices"][ic]))
+  # The arrays sized from the first walk hold exactly the kept points
+  block_id = int(flat["path"][0][0].name.split("_")[1])
+  filters = {"exclude": {"id": [block_id]}}
+  filtered = pt.read_chunk(usd_paths, flat=True, filters=filters)
+  expected = pt.flatten_chunks(pt.read_chunk(usd_paths, filters=filters))
+  assert 0 < filtered["offsets"][-1] < len(flat["points"])
+  for key in ("points", "indices", "offsets"):
+    assert np.array_equal(filtered[key], expected[key])
+
+def test_prototype_table(flat: dict, blocks: dict):
+  proto = pt.global_indices(flat, blocks)
+  for ic, targets in enumerate(flat["path"]):
+    start, end = flat["offsets"][ic], flat["offsets"][ic + 1]
+    local = flat["indices"][start:end]
+    assert [blocks["path"][g] for g in proto[start:end]] == [targets[i] for i in local]
+  assert len(set(blocks["path"])) == len(blocks["path"])
+  assert sorted(blocks["id"]) == sorted(int(b.split('_')[1]) for b in blocks["block"])
+
+def test_global_indices_chunk(flat: dict, blocks: dict):
+  proto = pt.global_indices(flat, blocks)
+  for ic in range(len(flat["chunks"])):
+    start, end = flat["offsets"][ic], flat["offsets"][ic + 1]
+    assert np.array_equal(pt.global_indices(flat, blocks, ic), proto[start:end])
+  assert [blocks["lookup"][path] for path in blocks["path"]] == list(range(len(blocks["path"])))
+
+def test_material_table(usd_paths: dict, blocks: dict):
+  meshes = pt.read_mesh(usd_paths, blocks)
+  assert len(meshes["material"]) == len(meshes["lookup"]) == len(meshes["mesh"])
+  assert (meshes["mesh_material"] >= 0).all()
+  assert len(meshes["texture"]) == len(set(t.path for t in meshes["texture"]))
+
+def test_material_binding(usd_paths: dict, blocks: dict):
+  meshes = pt.read_mesh(usd_paths, blocks)
+  for mesh, index in zip(meshes["mesh"], meshes["mesh_material"]):
+    targets = UsdShade.MaterialBindingAPI(mesh).GetDirectBindingRel().GetTargets()
+    assert meshes["material"][index] == targets[0]
+  for material, texture in zip(meshes["material"], meshes["material_texture"]):
+    shader = usd_paths["stage"].GetPrimAtPath(material.AppendChild("diffuse_texture"))
+    assert meshes["texture"][texture].path == shader.GetAttribute("inputs:file").Get().path
+
+def test_voxel_neighbours(flat: dict):
+  grid = pt.voxel_grid(flat)
+  neighbours = pt.voxel_neighbours(grid)
+  coords = grid["coords"]
+  lookup = {tuple(c): i for i, c in enumerate(coords)}
+  for d, offset in enumerate(pt.NEIGHBOURS):
+    expected = [lookup.get(tuple(c + offset), -1) for c in coords]
+    assert np.array_equal(neighbours["index"][:, d], expected)
+    assert np.array_equal((neighbours["mask"] >> d) & 1, np.array(expected) >= 0)
+
+def test_adjacent_point(flat: dict, blocks: dict):
+  grid = pt.voxel_grid(flat)
+  proto = pt.global_indices(flat, blocks)
+  neighbours = pt.voxel_neighbours(grid, proto)
+  edges = pt.adjacent_point(flat, grid, neighbours)
+  coords = grid["coords"]
+  assert len(set(map(tuple, np.sort(edges, axis=1)))) == len(edges)
+  assert (np.abs(coords[edges[:, 0]] - coords[edges[:, 1]]).sum(axis=1) == 1).all()
+  found = neighbours["index"] >= 0
+  assert len(edges) == found.sum() // 2
+  assert np.array_equal(neighbours["block"][found], proto[neighbours["index"][found]])
+
+def test_cull_occluded(usd_paths: dict, flat: dict, blocks: dict):
+  opaque = np.ones(len(blocks["path"]), dtype=bool)
+  culled = pt.cull_occluded(flat, blocks, opaque)
+  # 600 points fill two full 16x16 layers and part of a third, every
+  # chunk touches its neighbours so only the world border stays
+  assert culled["culled"].sum() > 0
+  assert culled["offsets"][-1] + culled["culled"].sum() == len(flat["points"])
+  # Same points as the full neighbour table would drop
+  neighbours = pt.voxel_neighbours(pt.voxel_grid(flat), pt.global_indices(flat, blocks))["block"]
+  for opaque in (opaque, np.arange(len(blocks["path"])) % 2 == 0):
+    solid = ((neighbours >= 0) & opaque[np.maximum(neighbours, 0)]).all(axis=1)
+    assert np.array_equal(pt.cull_occluded(flat, blocks, opaque)["points"], flat["points"][~solid])
+  opacity = pt.block_opacity(usd_paths, blocks)
+  assert not opacity[blocks["merged"]].any()
+
+def test_region(world: dict):
+  index = pt.index_chunks(world, counts=True)
+  assert index["count"].tolist() == [600] * 6
+  selected = pt.select_chunks(index, box=((0, 0, 0), (15, 1, 15)))
+  assert selected == ["/Chunk_0_0"]
+  region = pt.read_usd(world, {"center": (8, 0, 8), "radius": 10})
+  assert [c.GetName() for c in region["chunk"] if "Chunk" in c.GetName()] == ["Chunk_0_0", "Chunk_1_0", "Chunk_0_1"]
+
+def test_region_chunks(world: dict, flat: dict):
+  region = {"box": ((0, 0, 0), (20, 1, 15))}
+  chunks = pt.read_chunk(pt.read_usd(world, region), flat=True)
+  assert chunks["chunks"] == ["/Chunk_0_0", "/Chunk_1_0"]
+  for ic, name in enumerate(chunks["chunks"]):
+    points, indices = pt.chunk_slice(flat, flat["chunks"].index(name))
+    assert np.array_equal(pt.chunk_slice(chunks, ic)[0], points)
+    assert np.array_equal(pt.chunk_slice(chunks, ic)[1], indices)
+
+def test_read_chunk_parallel(world: dict, flat: dict):
+  chunks = pt.read_chunk_parallel(world, workers=2)
+  assert chunks["chunks"] == flat["chunks"]
+  assert chunks["path"] == flat["path"]
+  assert np.array_equal(chunks["points"], flat["points"])
+  assert np.array_equal(chunks["indices"], flat["indices"])
+  # The world arrays are the shared memory, not a copy of it
+  assert not chunks["points"].flags.owndata and not chunks["indices"].flags.owndata
+  points = pt.chunk_slice(chunks, 1)[0]
+  del chunks
+  assert np.array_equal(points, pt.chunk_slice(flat, 1)[0])
+
+def test_cache(world: dict, usd_paths: dict, flat: dict, blocks: dict):
+  meshes = pt.read_mesh(usd_paths, blocks)
+  assert pt.load_cache(world, {"test": 1}) is None
+  pt.save_cache(world, flat, blocks, meshes, {"test": 1})
+  chunks, cached_blocks, cached_meshes = pt.load_cache(world, {"test": 1})
+  assert isinstance(chunks["points"], np.memmap)
+  assert np.array_equal(pt.global_indices(chunks, cached_blocks), pt.global_indices(flat, blocks))
+  assert cached_meshes["instance"] == meshes["instance"]
+  Path(world["blocklib_filepath"]).touch()
+  assert pt.load_cache(world, {"test": 1}) is None
+
+def test_cache_options(world: dict, usd_paths: dict, flat: dict, blocks: dict):
+  meshes = pt.read_mesh(usd_paths, blocks)
+  culled = {"region": None, "cull": True, "filters": None}
+  plain = dict(culled, cull=False)
+  assert pt.cache_path(world, culled) != pt.cache_path(world, plain)
+  pt.save_cache(world, flat, blocks, meshes, culled)
+  assert pt.load_cache(world, plain) is None
+  assert pt.load_cache(world, culled) is not None
+
+def test_synth_stage(tmp_path: Path):
+  synth = synth_stage.write_world(str(tmp_path), chunks=3, points=300, prototypes=8, merged_ratio=0.5, palette=4)
+  index = pt.index_chunks(pt.read_path(synth["file_path"]), counts=True)
+  assert index["count"].tolist() == [300] * 3
+  stage = Usd.Stage.Open(synth["blocklib_filepath"])
+  blocks = [b for b in stage.GetPrimAtPath("/BlockLib/Blocks").GetChildren() if b.GetName() != "Looks"]
+  assert len(blocks) == 8
+  assert sum(len(b.GetChildren()) >= 2 for b in blocks) == 4
+  result = benchmark.bench_world(synth["file_path"])
+  assert result["points"] == 900 and result["prototypes"] <= 8
+  assert [s["stage"] for s in result["stages"]] == ["read_usd", "read_chunk", "read_block", "read_mesh"]
+
+def test_report(tmp_path: Path, usd_paths: dict):
+  report = pt.new_report(profile_dir=str(tmp_path / "prof"))
+  with pt.report_stage(report, "read_chunk") as counters:
+    chunks = pt.read_chunk(usd_paths, flat=True)
+    counters["points"] = len(chunks["points"])
+  pt.write_report(report, str(tmp_path / "report.json"))
+  stage = json.loads((tmp_path / "report.json").read_text())["stages"][0]
+  assert stage["stage"] == "read_chunk" and stage["counters"]["points"] == 3600
+  assert (tmp_path / "prof" / "read_chunk.prof").exists()
+
+def test_report_nested(tmp_path: Path):
+  def after_inner():
+    time.sleep(0.01)
+
+  report = pt.new_report(profile_dir=str(tmp_path / "prof"))
+  with pt.report_stage(report, "outer"):
+    with pt.report_stage(report, "inner") as counters:
+      counters["objects"] = 1
+    after_inner()
+  pt.write_report(report, str(tmp_path / "report.json"))
+  written = json.loads((tmp_path / "report.json").read_text())
+  inner, outer = written["stages"]
+  assert inner["parent"] == "outer" and "parent" not in outer
+  assert written["seconds"] == outer["seconds"]
+  assert not (tmp_path / "prof" / "inner.prof").exists()
+  functions = pstats.Stats(str(tmp_path / "prof" / "outer.prof")).stats
+  assert any(name == "after_inner" for _, _, name in functions)
+
+def test_report_counters(world: dict):
+  report = pt.read_world(world["file_path"])["report"]
+  counters = {stage["stage"]: stage["counters"] for stage in report["stages"]}
+  assert counters["read_usd"]["chunks"] == 6
+  assert counters["read_chunk"] == {"chunks": 6, "points": 3600}
+  assert counters["read_block"]["prototypes"] == report["counters"]["prototypes"]
+  assert counters["read_mesh"]["materials"] == report["counters"]["materials"] > 0
+
+class FakeData:
+  def __init__(self):
+    self.values = {}
+
+  def foreach_set(self, name, values):
+    self.values[name] = np.asarray(values)
+
+class FakeAttributes(dict):
+  def new(self, name, type, domain):
+    self[name] = attribute = FakeData()
+    attribute.data = attribute
+    return attribute
+
+class FakeMesh:
+  def __init__(self):
+    self.vertices = FakeData()
+    self.vertices.add = lambda count: setattr(self.vertices, "count", count)
+    self.attributes = FakeAttributes()
+
+  def update(self):
+    pass
+
+def test_point_buffers(flat: dict, blocks: dict):
+  buffers = pt.point_buffers(flat, blocks, 1)
+  points, indices = pt.chunk_slice(flat, 1)
+  co = buffers["co"].reshape(-1, 3)
+  assert buffers["co"].dtype == np.float32 and buffers["co"].flags["C_CONTIGUOUS"]
+  assert np.array_equal(co, points[:, [0, 2, 1]])
+  proto = pt.global_indices(flat, blocks, 1)
+  assert np.array_equal(buffers["block_index"], blocks["id"][proto])
+  mesh = pt.build_point_mesh(FakeMesh(), buffers)
+  assert mesh.vertices.count == len(points)
+  assert np.array_equal(mesh.attributes["instance_index"].values["value"], indices)
+
+def test_greedy_quads():
+  coords = np.stack(np.meshgrid(range(3), range(2), range(2), indexing="ij"), -1).reshape(-1, 3)
+  grid = pt.voxel_grid({"points": coords.astype(np.float32), "indices": np.zeros(len(coords), np.int32),
+                        "offsets": np.array([0, len(coords)])})
+  face_material = np.zeros((len(coords), 6), dtype=np.int32)
+  face_material[pt.voxel_neighbours(grid)["index"] >= 0] = -1
+  quads = pt.greedy_quads(grid["coords"], face_material)
+  assert len(quads["direction"]) == 6
+  area = (quads["u1"] - quads["u0"]) * (quads["v1"] - quads["v0"])
+  assert area.sum() == (face_material >= 0).sum() == 2 * (6 + 6 + 4)
+  points, st, normals = pt.quad_geometry(quads)
+  corners = points.reshape(-1, 4, 3)
+  cross = np.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0])
+  assert np.array_equal(np.sign(cross), normals.reshape(-1, 4, 3)[:, 0])
+
+def test_quad_st(usd_paths: dict, blocks: dict):
+  meshes = pt.read_mesh(usd_paths, blocks)
+  faces = pt.block_faces(usd_paths, blocks, meshes)
+  for ib, block in enumerate(blocks["path"]):
+    # st of every face corner of the source block, by direction and position
+    source = {}
+    for mesh in usd_paths["stage"].GetPrimAtPath(block).GetChildren():
+      verts = np.array(mesh.GetAttribute("points").Get())
+      st = np.array(UsdGeom.PrimvarsAPI(mesh).GetPrimvar("st").ComputeFlattened()).reshape(-1, 4, 2)
+      for face, face_st in zip(np.array(mesh.GetAttribute("faceVertexIndices").Get()).reshape(-1, 4), st):
+        a = int(np.argmin(np.ptp(verts[face], axis=0)))
+        d = 2 * a + int(verts[face][0, a] == faces["origin"][ib][a])
+        for corner, uv in zip(verts[face], face_st):
+          source[d, tuple(corner)] = tuple(uv)
+    face_material = np.full((6, 6), -1, dtype=np.int32)
+    face_material[np.arange(6), np.arange(6)] = faces["material"][ib]
+    face_uv = np.repeat(faces["uv"][ib][None], 6, axis=0)
+    quads = pt.greedy_quads(np.zeros((6, 3), dtype=np.int64), face_material, face_uv)
+    points, st, normals = pt.quad_geometry(quads, faces["origin"][ib])
+    for d, corner, uv in zip(np.repeat(quads["direction"], 4), points, st):
+      assert source[d, tuple(corner)] == tuple(uv)
+
+def test_write_greedy_layer(world: dict, usd_paths: dict, flat: dict, blocks: dict):
+  meshes = pt.read_mesh(usd_paths, blocks)
+  faces = pt.block_faces(usd_paths, blocks, meshes)
+  assert faces["cube"].all()
+  out_path = str(Path(world["file_path"]).with_name("greedy.usda"))
+  # The second write reuses the layer the first stage still holds open
+  for _ in range(2):
+    out = pt.write_greedy_layer(world, usd_paths, flat, blocks, meshes, out_path)
+    stage = Usd.Stage.Open(out)
+  greedy = [p for p in stage.Traverse() if p.IsA(UsdGeom.Mesh) and "GreedyMesh" in str(p.GetPath())]
+  assert greedy
+  for prim in greedy:
+    material = UsdShade.MaterialBindingAPI(prim).GetDirectBinding().GetMaterial()
+    assert material.GetPrim().IsValid()
+
+def test_layers_elsewhere(tmp_path: Path, world: dict, usd_paths: dict, flat: dict, blocks: dict):
+  # Written outside the export directory, the references are rebased
+  meshes = pt.read_mesh(usd_paths, blocks)
+  out = pt.write_greedy_layer(world, usd_paths, flat, blocks, meshes, str(tmp_path / "out" / "greedy.usda"))
+  stage = Usd.Stage.Open(out)
+  greedy = [p for p in stage.Traverse() if p.IsA(UsdGeom.Mesh) and "GreedyMesh" in str(p.GetPath())]
+  assert greedy
+  material = UsdShade.MaterialBindingAPI(greedy[0]).GetDirectBinding().GetMaterial()
+  shader = UsdShade.Shader(material.GetPrim().GetChild("diffuse_texture"))
+  assert shader.GetInput("wrapS").Get() == "repeat" and shader.GetInput("wrapT").Get() == "repeat"
+  out = pt.write_lod_layer(world, usd_paths, flat, blocks, meshes, (2,), str(tmp_path / "lod.usda"))
+  stage = Usd.Stage.Open(out)
+  chunk = stage.GetPrimAtPath(pt.voxelmap_path(world) + "/Chunk_0_0")
+  assert len(chunk.GetAttribute("positions").Get()) == 600
+
+def test_lod_cells():
+  coords = np.array([[0, 0, 0], [1, 0, 0], [0, 1, 0], [1, 1, 1], [3, 3, 3]])
+  cells, labels = pt.lod_cells(coords, np.array([2, 2, 1, 2, 0]), 2)
+  assert cells.tolist() == [[0, 0, 0]] and labels.tolist() == [2]
+
+def test_write_lod_layer(world: dict, usd_paths: dict, flat: dict, blocks: dict):
+  meshes = pt.read_mesh(usd_paths, blocks)
+  out_path = str(Path(world["file_path"]).with_name("lod.usda"))
+  for _ in range(2):
+    out = pt.write_lod_layer(world, usd_paths, flat, blocks, meshes, (2, 4), out_path)
+    stage = Usd.Stage.Open(out)
+  chunk = stage.GetPrimAtPath(pt.voxelmap_path(world) + "/Chunk_0_0")
+  lod = chunk.GetVariantSets().GetVariantSet("lod")
+  assert lod.GetVariantSelection() == "full"
+  assert len(chunk.GetAttribute("positions").Get()) == 600
+  lod.SetVariantSelection("x2")
+  # 8x8 full cells from the two bottom layers, plus the upper cells that
+  # the 88 points of the third layer fill at least half way
+  assert len(chunk.GetAttribute("positions").Get()) == 64 + 20
+  assert chunk.GetAttribute("scales").Get()[0] == (2, 2, 2)
+
+def test_diff_chunks(flat: dict):
+  hashes = pt.chunk_hashes(flat)
+  assert len(set(hashes)) == len(hashes)
+  previous = dict(zip(flat["chunks"], hashes))
+  changed = dict(flat, indices=flat["indices"].copy())
+  changed["indices"][flat["offsets"][2]] += 1
+  names = flat["chunks"][1:] + ["/Chunk_9_9"]
+  new_hashes = pt.chunk_hashes(changed)[1:] + ["new"]
+  diff = pt.diff_chunks(previous, names, new_hashes)
+  assert diff["added"] == ["/Chunk_9_9"]
+  assert diff["removed"] == [flat["chunks"][0]]
+  assert diff["modified"] == [flat["chunks"][2]]
+  assert len(diff["unchanged"]) == len(flat["chunks"]) - 2
+
+def test_diff_chunks_global(flat: dict, blocks: dict):
+  # Same chunk content, but its prototypes moved in the global table
+  hashes = pt.chunk_hashes(flat, blocks)
+  assert pt.chunk_hashes(flat) != hashes
+  shifted = dict(blocks, remap=[r + 1 for r in blocks["remap"]])
+  diff = pt.diff_chunks(dict(zip(flat["chunks"], hashes)), flat["chunks"], pt.chunk_hashes(flat, shifted))
+  assert diff["modified"] == flat["chunks"]
+
+def test_dedupe_textures(tmp_path: Path):
+  synth = synth_stage.write_world(str(tmp_path), chunks=2, points=64, prototypes=8, palette=8, duplicate_ratio=0.5)
+  paths = pt.read_path(synth["file_path"])
+  usd_paths = pt.read_usd(paths)
+  meshes = pt.read_mesh(usd_paths, pt.read_block(usd_paths, pt.read_chunk(usd_paths, flat=True)))
+  textures = pt.dedupe_textures(meshes)
+  unique = textures["unique"]
+  assert len(set(unique.tolist())) < len(unique)
+  assert all(textures["hash"][i] == textures["hash"][u] for i, u in enumerate(unique))
+  summary = pt.write_texture_layer(paths, usd_paths, meshes)
+  stage = Usd.Stage.Open(summary["layer"])
+  files = {stage.GetPrimAtPath(m.AppendChild("diffuse_texture")).GetAttribute("inputs:file").Get().resolvedPath
+           for m in meshes["material"]}
+  assert len(files) == summary["unique"] == len(set(unique.tolist()))
+
+def test_texture_atlas(world: dict, usd_paths: dict, blocks: dict):
+  pytest.importorskip("PIL")
+  meshes = pt.read_mesh(usd_paths, blocks)
+  summary = pt.write_texture_layer(world, usd_paths, meshes, atlas=True,
+                                   out_path=str(Path(world["file_path"]).with_name("atlas.usda")))
+  width, height = summary["atlas"]
+  assert width * height >= 16 * 16 * summary["unique"]
+  stage = Usd.Stage.Open(summary["layer"])
+  st = [np.array(stage.GetPrimAtPath(m.GetPath()).GetAttribute("primvars:st").Get()) for m in meshes["mesh"]]
+  assert all(((s >= 0) & (s <= 1)).all() for s in st)
+  assert len({tuple(s.min(axis=0)) for s in st}) > 1
+  shader = stage.GetPrimAtPath(meshes["material"][0].AppendChild("diffuse_texture"))
+  assert shader.GetAttribute("inputs:wrapS").Get() == "clamp"
+
+def test_atlas_padding(tmp_path: Path):
+  Image = pytest.importorskip("PIL.Image")
+  pixels = np.arange(2 * 3 * 4, dtype=np.uint8).reshape(2, 3, 4) * 10
+  files = [str(tmp_path / "a.png"), str(tmp_path / "b.png")]
+  for file_path in files:
+    synth_stage.write_png(file_path, pixels)
+  size, rects = pt.pack_atlas(files, str(tmp_path / "atlas.png"), pad=2)
+  atlas = np.asarray(Image.open(tmp_path / "atlas.png"))
+  for x, y, w, h in rects:
+    assert (w, h) == (3, 2)
+    assert (atlas[y:y + h, x:x + w] == pixels).all()
+    # Edge pixels are extruded around every rect
+    assert (atlas[y - 2:y, x:x + w] == pixels[0]).all()
+    assert (atlas[y:y + h, x + w:x + w + 2] == pixels[:, -1:]).all()
+
+def test_read_world_cached(tmp_path: Path):
+  synth = synth_stage.write_world(str(tmp_path), chunks=2, points=300, prototypes=6, palette=3)
+  options = {"cache": True, "compact": True, "prune": True, "textures": "dedupe"}
+  cold = pt.read_world(synth["file_path"], **options)
+  warm = pt.read_world(synth["file_path"], **options)
+  stages = [stage["stage"] for stage in warm["report"]["stages"]]
+  assert stages == ["load_cache", "read_usd", "compact", "prune", "textures"]
+  assert warm["import_path"] == cold["import_path"] == str(Path(synth["file_path"]).with_name("synth_textures.usda"))
+  assert "origin" in warm["chunks"]
+  assert np.array_equal(pt.flatten_chunks(cold["chunks"])["points"], pt.flatten_chunks(warm["chunks"])["points"])
+  assert warm["report"]["counters"] == cold["report"]["counters"]
+
+def test_batch(tmp_path: Path):
+  exports = [synth_stage.write_world(str(tmp_path), chunks=2, points=64, prototypes=4, palette=4,
+                                     world_name=name)["file_path"] for name in ("A", "B")]
+  assert batch.find_exports([str(tmp_path)]) == sorted(exports)
+  summary = batch.convert_world(exports[0], {"cull": True, "cache": True, "lod": True})
+  assert "error" not in summary and summary["counters"]["points"] <= 128
+  assert Path(summary["outputs"][0]).exists() and Path(summary["report"]).exists()
+  assert batch.find_exports([str(tmp_path)]) == sorted(exports)
+  assert batch.convert_world(exports[0], {"cull": True, "cache": True})["counters"] == summary["counters"]
+  assert "error" in batch.convert_world(str(tmp_path / "missing.usda"), {})
+  results = batch.run_batch([exports[1], str(tmp_path / "missing.usda")], {"greedy": True}, workers=2)
+  assert "error" not in results[0] and "error" in results[1]
+  # A world over the budget ends its worker, the batch still returns
+  results = batch.run_batch(exports, {}, workers=1, max_memory=1)
+  assert all(r["error"].startswith("MemoryError") for r in results)
+
+@pytest.mark.parametrize("rle", [False, True])
+def test_compact_chunks(usd_paths: dict, flat: dict, blocks: dict, rle: bool):
+  compact = pt.compact_chunks(flat, rle)
+  assert compact["local"].dtype == np.int8 and compact["indices"].dtype == np.uint8
+  nbytes = sum(v.nbytes for v in compact.values() if isinstance(v, np.ndarray))
+  assert nbytes < (flat["points"].nbytes + flat["indices"].nbytes) / 2
+  expanded = pt.flatten_chunks(compact)
+  assert np.array_equal(expanded["points"], flat["points"])
+  assert np.array_equal(expanded["indices"], flat["indices"])
+  assert np.array_equal(pt.global_indices(compact, blocks, 3), pt.global_indices(flat, blocks, 3))
+  read = pt.read_chunk(usd_paths, compact=True, rle=rle)
+  assert all(np.array_equal(read[k], compact[k]) for k in ("origin", "local", "indices", "offsets"))
+  # Every chunk is narrowed as it is encoded, not only once packed
+  encoded = pt.encode_chunk(*pt.chunk_slice(flat, 0), rle)
+  assert encoded["local"].dtype == np.int8 and encoded["indices"].dtype == np.uint8
+  if rle:
+    assert len(compact["length"]) < len(flat["points"])
+  shifted = dict(flat, points=flat["points"] + 0.5)
+  start, end = flat["offsets"][2], flat["offsets"][3]
+  assert np.array_equal(pt.chunk_slice(pt.compact_chunks(shifted, rle), 2)[0], shifted["points"][start:end])
+
+def test_write_pruned_library(tmp_path: Path):
+  synth = synth_stage.write_world(str(tmp_path), chunks=9, points=100, prototypes=40, palette=6)
+  paths = pt.read_path(synth["file_path"])
+  usd_paths = pt.read_usd(paths, {"center": (8, 0, 8), "radius": 10})
+  chunks = pt.read_chunk(usd_paths, flat=True)
+  blocks = pt.read_block(usd_paths, chunks)
+  summary = pt.write_pruned_library(paths, usd_paths, chunks, blocks)
+  assert summary["blocks"][0] == pt.used_prototypes(chunks, blocks).sum() < summary["blocks"][1]
+  pruned = pt.read_usd(dict(paths, file_path=summary["layer"]))
+  pruned_chunks = pt.read_chunk(pruned, flat=True)
+  pruned_blocks = pt.read_block(pruned, pruned_chunks)
+  assert pruned_chunks["chunks"] == chunks["chunks"]
+  assert np.array_equal(pruned_chunks["points"], chunks["points"])
+  assert ([blocks["path"][i] for i in pt.global_indices(chunks, blocks)]
+          == [pruned_blocks["path"][i] for i in pt.global_indices(pruned_chunks, pruned_blocks)])
+  meshes = pt.read_mesh(pruned, pruned_blocks)
+  assert len(meshes["material"]) == summary["materials"][0] < summary["materials"][1]
+  assert all(pruned["stage"].GetPrimAtPath(m).IsValid() for m in meshes["material"])
+  # Pruning again while the stage still holds both layers rewrites them
+  assert pt.write_pruned_library(paths, usd_paths, chunks, blocks) == summary
+  again = pt.read_usd(dict(paths, file_path=summary["layer"]))
+  again_chunks = pt.read_chunk(again, flat=True)
+  assert np.array_equal(again_chunks["points"], chunks["points"])
+  assert len(pt.read_block(again, again_chunks)["path"]) == len(pruned_blocks["path"])
+
+def test_iter_chunks(usd_paths: dict, flat: dict, blocks: dict):
+  items = pt.iter_chunks(usd_paths, lookahead=2)
+  for item in items:
+    points, indices = pt.chunk_slice(flat, item["index"])
+    assert item["chunk"] == flat["chunks"][item["index"]]
+    assert np.array_equal(item["points"], points) and np.array_equal(item["indices"], indices)
+  registry = pt.finish_blocks(item["blocks"])
+  assert registry["path"] == blocks["path"] and np.array_equal(registry["id"], blocks["id"])
+  items = pt.iter_chunks(usd_paths, lookahead=1)
+  first = next(items)
+  items.close()
+  assert first["index"] == 0 and len(first["blocks"]["path"]) == len(first["path"])
+  assert not any(t.name == "iter_chunks" for t in threading.enumerate())
+
+def test_inspect_world(world: dict, flat: dict, blocks: dict):
+  assert all(b["name"] is None for b in pt.inspect_world(world)["blocks"])
+  report = pt.inspect_world(world, names=True)
+  assert report["chunks"] == 6 and report["instances"] == len(flat["points"])
+  proto = pt.global_indices(flat, blocks)
+  counts = np.bincount(proto, minlength=len(blocks["path"]))
+  assert {b["block"]: b["count"] for b in report["blocks"]} == {
+    blocks["block"][i][1:]: int(c) for i, c in enumerate(counts)}
+  assert all(b["name"] == blocks["name"][blocks["block"].index("/" + b["block"])] for b in report["blocks"])
+  assert sum(report["ids"].values()) == report["instances"]
+  assert report["per_chunk"][0]["min"] == flat["points"][:600].min(axis=0).tolist()
+  assert report["bounds"]["max"] == (flat["points"].max(axis=0) + 1).tolist()
+
+def test_write_region_layer(world: dict, usd_paths: dict, flat: dict, blocks: dict):
+  out_path = str(Path(world["file_path"]).with_name("regions.usdc"))
+  # The second write reuses the layer the first stage still holds open
+  for _ in range(2):
+    summary = pt.write_region_layer(world, usd_paths, flat, blocks, tile=2, out_path=out_path)
+    stage = Usd.Stage.Open(summary["layer"])
+  assert summary["chunks"] == 6 and summary["regions"] == 2
+  assert Path(summary["layer"]).read_bytes()[:8] == b"PXR-USDC"
+  regions = pt.read_usd(dict(world, file_path=summary["layer"]))
+  chunks = pt.read_chunk(regions, flat=True)
+  assert chunks["chunks"] == ["/RegionChunk_0_0", "/RegionChunk_1_0"]
+  assert all(targets == chunks["path"][0] for targets in chunks["path"])
+  region_blocks = pt.read_block(regions, chunks)
+  before = sorted(zip(map(tuple, flat["points"].tolist()), (blocks["path"][i] for i in pt.global_indices(flat, blocks))))
+  targets = (region_blocks["path"][i] for i in pt.global_indices(chunks, region_blocks))
+  after = sorted(zip(map(tuple, chunks["points"].tolist()), targets))
+  assert before == after
+  assert pt.region_name(-3, 4) == "RegionChunk_n3_4"
+
+def test_filter_blocks(world: dict, usd_paths: dict, flat: dict, blocks: dict):
+  targets = blocks["path"]
+  names = {t.name: n for t, n in zip(targets, blocks["name"])}
+  ids = sorted(set(blocks["id"].tolist()))
+  filters = {"include": {"id": ids[:4]}, "exclude": {"id": [[ids[0], 0]], "name": ["BLOCK_%d" % ids[1]]}}
+  keep = pt.filter_blocks(filters, targets, names)
+  assert keep.tolist() == [i in ids[2:4] for i in blocks["id"].tolist()]
+  expected = keep[pt.global_indices(flat, blocks)]
+  chunks = pt.read_chunk(usd_paths, flat=True, filters=filters)
+  assert np.array_equal(chunks["points"], flat["points"][expected])
+  assert np.array_equal(pt.global_indices(chunks, blocks), pt.global_indices(flat, blocks)[expected])
+  parallel = pt.read_chunk_parallel(world, workers=2, filters=filters)
+  assert np.array_equal(parallel["points"], chunks["points"])
+  assert np.array_equal(parallel["indices"], chunks["indices"])
+  streamed = np.concatenate([item["points"] for item in pt.iter_chunks(usd_paths, filters=filters)])
+  assert np.array_equal(streamed, chunks["points"])
+  region = pt.read_chunk_parallel(world, workers=2, region={"box": ((0, 0, 0), (15, 1, 15))}, filters=filters)
+  assert np.array_equal(region["points"], chunks["points"][:chunks["offsets"][1]])
+
+def test_compact_empty_chunks(world: dict, flat: dict, blocks: dict):
+  # Filters that leave chunks without points, read compact with and without culling
+  empty = {"exclude": {"name": ["*"]}}
+  for cull in (False, True):
+    chunks = pt.read_world(world["file_path"], compact=True, cull=cull, filters=empty)["chunks"]
+    assert chunks["length"].dtype == np.uint8 and not len(chunks["length"])
+    assert chunks["offsets"].tolist() == [0] * 7
+  encoded = pt.encode_chunk(np.zeros((0, 3)), np.zeros(0), rle=True)
+  assert encoded["length"].dtype == np.uint8 and not len(encoded["length"])
+  some = pt.read_world(world["file_path"], compact=True, filters={"include": {"id": [blocks["id"][0]]}})["chunks"]
+  assert pt.flatten_chunks(some)["points"].tolist() == flat["points"][blocks["id"][pt.global_indices(flat, blocks)] ==
+                                                                     blocks["id"][0]].tolist()
+
+def test_lazy_imports():
+  code = ("import sys, mineways_pointinstancer as pt; pt.chunk_slice; "
+          "print(sorted(m for m in ('pxr', 'bpy', 'mathutils') if m in sys.modules))")
+  out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True,
+                       cwd=Path(__file__).parent.parent).stdout
+  assert out.strip() == "[]"
+  assert "import_world" in dir(pt)
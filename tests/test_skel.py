@@ -56,3 +56,21 @@ def test_anim_anim():
   rig.anim_from_json(anims)
   print("Hard part.")
   
+
+def test_create_animation(tmp_path):
+  bones = [
+    {"name": "root", "pivot": [0, 0, 0]},
+    {"name": "arm", "parent": "root", "pivot": [0, 8, 0]},
+  ]
+  rig = UsdRigWrite()
+  rig.create_stage(str(tmp_path / "anim.usda"))
+  rig.from_json(bones)
+  anim = rig.create_animation("walk", 1.0, {
+    "root": {"location": {"0.0": [0, 0, 0], "1.0": [0, 24, 0]}},
+    "arm": {"rotation": [90, 0, 0], "scale": 2},
+  })
+  translations = anim.GetTranslationsAttr()
+  assert len(translations.GetTimeSamples()) == 24
+  assert translations.Get(12)[0][1] == pytest.approx(12)
+  assert anim.GetRotationsAttr().Get(0)[1].GetImaginary()[0] == pytest.approx(2 ** -0.5, rel=1e-3)
+  assert anim.GetScalesAttr().Get(5)[1][0] == 2